@@ -1,41 +1,34 @@
+import re
 import streamlit as st
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain.memory import ConversationBufferMemory
 import logging
 from langchain_community.vectorstores import Chroma
 from utils.vector_store import get_vector_store, get_chroma_client
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, EMBEDDING_MODEL
 from langchain.chains.conversational_retrieval.base import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
 from langchain_core.messages.ai import AIMessage
-from utils.retriever import get_retriever, get_parent_child_retriever, get_self_query_retriever, get_multi_query_retriever
+from utils.retriever import get_retriever, get_parent_child_retriever, get_candidate_retriever, get_reranking_retriever, plan_retrieval_filter
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.retrievers import MergerRetriever
-from utils.emi_agent import emi_tool
-from utils.forex_agent import forex_tool
+from utils.emi_agent import calculate_emi
+from utils.forex_agent import convert_forex
 from langchain.chains.question_answering import load_qa_chain
 from langchain.chains import LLMChain
+from utils.cache import llm_result_cache
+from utils.faq_store import get_faq_store
 
 
 logger = logging.getLogger(__name__)
 
+ERROR_RESPONSE = "I encountered an issue while processing your query. Could you please rephrase or ask a different question?"
 
-def process_query(llm, query, memory):
-    logger.debug(f"Processing query: {query}")
-    
-    active_collection = get_vector_store()
-    embeddings = OpenAIEmbeddings(model="text-embedding-ada-002", openai_api_key=OPENAI_API_KEY)
-    chroma_client, _ = get_chroma_client()
-    vector_store = Chroma(client=chroma_client, collection_name=active_collection.name, embedding_function=embeddings)
-    
-    basic_retriever = get_retriever(vector_store)
-    parent_child_retriever = get_parent_child_retriever(vector_store, RecursiveCharacterTextSplitter(chunk_size=500))
-    self_query_retriever = get_self_query_retriever(vector_store, llm)
-    multi_query_retriever = get_multi_query_retriever(vector_store)
-    
-    combined_retriever = MergerRetriever(retrievers=[multi_query_retriever])
+# Word boundaries keep "remittance" or "premium" from routing to the EMI calculator
+EMI_PATTERN = re.compile(r"\bemis?\b", re.IGNORECASE)
+FOREX_PATTERN = re.compile(r"\b(?:forex|exchange|convert|currenc)", re.IGNORECASE)
 
-    prompt_template = """
+PROMPT_TEMPLATE = """
     You are an expert AI assistant for our bank, equipped with comprehensive knowledge about our services, policies, and operations. Your primary goal is to provide accurate, helpful, and concise information to our customers. Always maintain a professional and friendly tone.
 
     Key areas of expertise:
@@ -60,9 +53,65 @@ def process_query(llm, query, memory):
     AI Assistant: Based on the provided context, here's the most relevant and accurate answer:
     """
 
-    PROMPT = PromptTemplate(
-        template=prompt_template, input_variables=["context", "question"]
-    )
+PROMPT = PromptTemplate(
+    template=PROMPT_TEMPLATE, input_variables=["context", "question"]
+)
+
+
+def route_query(query):
+    if EMI_PATTERN.search(query):
+        return "emi"
+    if FOREX_PATTERN.search(query):
+        return "forex"
+    return "rag"
+
+
+def process_query(llm, query, memory):
+    logger.debug(f"Processing query: {query}")
+    route = route_query(query)
+
+    # Tool queries never retrieve, so answer them before any embeddings client or retriever is built
+    try:
+        if route == "emi":
+            emi_result = calculate_emi(query)
+            return f"EMI Calculation:\n{emi_result}"
+        if route == "forex":
+            forex_result = convert_forex(query)
+            if "I need more information" in forex_result:
+                memory.chat_memory.messages.append(AIMessage(content=f"I need more information for forex conversion: {query}"))
+            return f"Forex Conversion:\n{forex_result}"
+    except Exception as e:
+        logger.error(f"Error processing query: {e}")
+        return ERROR_RESPONSE
+
+    active_collection = get_vector_store()
+    try:
+        get_faq_store(active_collection.name).log_query(query)
+    except Exception as e:
+        logger.error(f"Error logging query to FAQ store: {e}")
+
+    try:
+        entry = get_faq_store(active_collection.name).lookup(query)
+        if entry:
+            memory.chat_memory.add_user_message(query)
+            memory.chat_memory.add_ai_message(entry["answer"])
+            logger.debug(f"Answered from FAQ store: {entry['question']}")
+            return entry["answer"]
+    except Exception as e:
+        logger.error(f"Error looking up FAQ store: {e}")
+
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY, openai_api_base=OPENAI_BASE_URL)
+    chroma_client, _ = get_chroma_client()
+    vector_store = Chroma(client=chroma_client, collection_name=active_collection.name, embedding_function=embeddings)
+    
+    where = plan_retrieval_filter(vector_store, llm, query)
+
+    basic_retriever = get_retriever(vector_store, where)
+    parent_child_retriever = get_parent_child_retriever(vector_store, RecursiveCharacterTextSplitter(chunk_size=500))
+    multi_query_retriever = get_candidate_retriever(vector_store, llm, where=where)
+    reranking_retriever = get_reranking_retriever(multi_query_retriever)
+    
+    combined_retriever = MergerRetriever(retrievers=[reranking_retriever])
 
     qa = load_qa_chain(llm, chain_type="stuff", prompt=PROMPT)
     qa_chain = ConversationalRetrievalChain(
@@ -73,23 +122,14 @@ def process_query(llm, query, memory):
     )
     
     try:
-        if "emi" in query.lower():
-            emi_result = emi_tool.run(query)
-            return f"EMI Calculation:\n{emi_result}"
-        elif any(keyword in query.lower() for keyword in ["forex", "exchange", "convert", "currency"]):
-            forex_result = forex_tool.run(query)
-            if "I need more information" in forex_result:
-                memory.chat_memory.messages.append(AIMessage(content=f"I need more information for forex conversion: {query}"))
-            return f"Forex Conversion:\n{forex_result}"
-        else:
-            response = qa_chain.invoke({"question": query, "chat_history": memory.chat_memory.messages})
-            answer = response['answer']
-            logger.debug(f"Query processed successfully using combined retrievers")
-            return answer
-        
+        response = qa_chain.invoke({"question": query, "chat_history": memory.chat_memory.messages})
+        answer = response['answer']
+        logger.debug(f"Query processed successfully using combined retrievers")
+        logger.debug(f"LLM result cache: {llm_result_cache.stats()}")
+        return answer
     except Exception as e:
         logger.error(f"Error processing query: {e}")
-        return "I encountered an issue while processing your query. Could you please rephrase or ask a different question?"
+        return ERROR_RESPONSE
 
 
 def render():
@@ -1,6 +1,9 @@
 import streamlit as st
 from utils.vector_store import create_collection, delete_collection, list_collections, select_collection
+from utils.snapshot import export_collection, import_collection
+from config import COLLECTIONS_FOLDER
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
@@ -44,3 +47,37 @@ def render():
         except Exception as e:
             logger.error(f"Error setting active collection: {str(e)}")
             st.error(f"Error setting active collection: {str(e)}")
+
+    col3, col4 = st.columns(2)
+
+    with col3:
+        st.subheader("Snapshot Collection")
+        collection_to_snapshot = st.selectbox("Select collection to snapshot", list_collections())
+        snapshot_path = st.text_input(
+            "Snapshot file",
+            os.path.join(COLLECTIONS_FOLDER, "snapshots", f"{collection_to_snapshot}.npz")
+        )
+        use_float16 = st.checkbox("Store vectors as float16")
+        compress = st.checkbox("Compress", value=True)
+        if st.button("Export"):
+            try:
+                os.makedirs(os.path.dirname(snapshot_path) or ".", exist_ok=True)
+                count = export_collection(collection_to_snapshot, snapshot_path, float16=use_float16, compress=compress)
+                logger.info(f"Collection '{collection_to_snapshot}' exported to {snapshot_path}")
+                st.success(f"Exported {count} records from '{collection_to_snapshot}' to {snapshot_path}")
+            except Exception as e:
+                logger.error(f"Error exporting collection: {str(e)}")
+                st.error(f"Error exporting collection: {str(e)}")
+
+    with col4:
+        st.subheader("Restore Snapshot")
+        restore_path = st.text_input("Snapshot file to restore")
+        restore_name = st.text_input("New collection name")
+        if st.button("Restore"):
+            try:
+                count = import_collection(restore_path, restore_name)
+                logger.info(f"Snapshot {restore_path} restored into '{restore_name}'")
+                st.success(f"Restored {count} records into '{restore_name}'")
+            except Exception as e:
+                logger.error(f"Error restoring snapshot: {str(e)}")
+                st.error(f"Error restoring snapshot: {str(e)}")
@@ -10,7 +10,11 @@ LANGCHAIN_API_KEY = st.secrets["langchain"]["LANGCHAIN_API_KEY"]
 langsmith_client = Client()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Point at a local stub server (python -m utils.stub_openai) for offline testing
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 COLLECTIONS_FOLDER = os.getenv("COLLECTIONS_FOLDER", "./collections")
+# Bundled exchange rates, query mixes and evaluation sets
+DATA_FOLDER = os.getenv("DATA_FOLDER", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
 os.environ["LANGCHAIN_API_KEY"] = os.getenv("LANGCHAIN_API_KEY")
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 os.environ["LANGCHAIN_ENDPOINT"] = "https://api.smith.langchain.com"
@@ -18,6 +22,38 @@ os.environ["LANGCHAIN_PROJECT"] = "Bot"
 PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION = os.getenv("PROTOCOL_BUFFERS_PYTHON_IMPLEMENTATION", "python")
 TOKENIZERS_PARALLELISM = "false"
 
+# "chroma" searches Chroma's HNSW index; "quantized" searches the memory-mapped int8/PQ index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+QUANTIZATION = os.getenv("QUANTIZATION", "int8")
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", "96"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))
+# PQ codebooks need enough vectors to train on; smaller indexes scan int8 codes instead
+PQ_MIN_TRAIN = int(os.getenv("PQ_MIN_TRAIN", "10000"))
+
+# Memoized query rewriting / self-query parsing; set LLM_CACHE_PATH to persist it across restarts
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "2048"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "")
+# Ask the LLM for a metadata filter on every RAG query; costs a round trip before retrieval starts
+SELF_QUERY_FILTER = os.getenv("SELF_QUERY_FILTER", "false").lower() == "true"
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "20000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_TOKENS_PER_MINUTE = int(os.getenv("EMBEDDING_TOKENS_PER_MINUTE", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+
+FAQ_MAX_ENTRIES = int(os.getenv("FAQ_MAX_ENTRIES", "300"))
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", "0.8"))
+FAQ_MIN_QUERY_COUNT = int(os.getenv("FAQ_MIN_QUERY_COUNT", "3"))
+
+# Retrieve RERANK_FETCH_K candidates, keep the best RERANK_TOP_N after local reranking
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "20"))
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "4"))
+RERANK_MODEL_PATH = os.getenv("RERANK_MODEL_PATH", os.path.join(COLLECTIONS_FOLDER, "reranker.pkl"))
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -1,12 +1,25 @@
 import streamlit as st
 from utils.document_loader import load_document
 from utils.document_splitter import split_document
-from utils.vector_store import add_texts_to_collection, get_indexed_documents
+from utils.vector_store import add_texts_to_collection, get_indexed_documents, get_vector_store
+from utils.faq_store import refresh_faq_store
+from langchain_openai import ChatOpenAI
+from chat import PROMPT
+from utils.metadata_extractor import build_chunk_metadatas
 import logging
 import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+def warm_faq_answers():
+    try:
+        with st.spinner("Precomputing answers to frequent questions..."):
+            count = refresh_faq_store(get_vector_store(), ChatOpenAI(temperature=0), PROMPT)
+        st.info(f"FAQ store holds {count} precomputed answers")
+    except Exception as e:
+        logger.error(f"Error warming FAQ store: {str(e)}")
+        st.warning("Documents were added, but precomputing FAQ answers failed.")
+
 def render():
     st.title("Document Management")
 
@@ -19,7 +32,7 @@ def render():
                     doc = load_document(uploaded_file)
                     logger.info(f"File uploaded: {uploaded_file.name}")
                     chunks = split_document(doc)
-                    metadatas = [{"filename": uploaded_file.name, "source": uploaded_file.name} for _ in chunks]
+                    metadatas = build_chunk_metadatas(chunks, uploaded_file.name, doc)
                     add_texts_to_collection([chunk.page_content for chunk in chunks], metadatas)
 
                     st.success(f"File processed and added to the collection: {uploaded_file.name}")
@@ -44,13 +57,14 @@ def render():
                     docs = load_document(uploaded_file)
                     logger.info(f"File uploaded: {uploaded_file.name}")
                     chunks = split_document(docs)
-                    metadatas = [{"source": uploaded_file.name} for _ in chunks]
+                    metadatas = build_chunk_metadatas(chunks, uploaded_file.name, docs)
                     add_texts_to_collection([chunk.page_content for chunk in chunks], metadatas)
 
                     st.success(f"File processed and added to the collection: {uploaded_file.name}")
                 except Exception as e:
                     logger.error(f"Error processing file {uploaded_file.name}: {str(e)}")
                     st.error(f"Error processing file {uploaded_file.name}: {str(e)}")
+            warm_faq_answers()
         else:
             st.warning("Please upload files before processing.")
 
@@ -1,8 +1,15 @@
+import atexit
 import hashlib
 import json
-from typing import Dict, Any
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 import openai
 import logging
+from config import LLM_CACHE_SIZE, LLM_CACHE_PATH
 
 logger = logging.getLogger(__name__)
 
@@ -32,3 +39,88 @@ class QueryCache:
         logger.info(f"Cached response for query: {query[:50]}...")
 
 query_cache = QueryCache()
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.strip().lower()).rstrip("?!. ")
+
+
+def template_hash(template: str) -> str:
+    return hashlib.sha256(template.encode()).hexdigest()[:16]
+
+
+class LLMResultCache:
+    """LRU cache for intermediate LLM results such as query variants and self-query filters."""
+
+    def __init__(self, max_size: int = LLM_CACHE_SIZE, persist_path: Optional[str] = LLM_CACHE_PATH, persist_every: int = 20):
+        self.max_size = max_size
+        self.persist_path = persist_path
+        self.persist_every = persist_every
+        self.cache: "OrderedDict[Tuple[str, str, str], Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def make_key(self, model: str, template: str, query: str) -> Tuple[str, str, str]:
+        return (model, template_hash(template), normalize_query(query))
+
+    def get(self, key: Tuple[str, str, str]) -> Any:
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: Tuple[str, str, str], value: Any):
+        with self._lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_size:
+                self.cache.popitem(last=False)
+            self._pending_writes += 1
+            should_save = self.persist_path and self._pending_writes >= self.persist_every
+        if should_save:
+            self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.cache),
+            }
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "rb") as f:
+                entries = pickle.load(f)
+            self.cache = OrderedDict(list(entries.items())[-self.max_size:])
+            logger.info(f"Loaded {len(self.cache)} cached LLM results from {self.persist_path}")
+        except Exception as e:
+            logger.error(f"Error loading LLM result cache: {str(e)}")
+
+    def save(self):
+        if not self.persist_path:
+            return
+        try:
+            with self._lock:
+                snapshot = OrderedDict(self.cache)
+                self._pending_writes = 0
+            os.makedirs(os.path.dirname(self.persist_path) or ".", exist_ok=True)
+            tmp_path = f"{self.persist_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(snapshot, f)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logger.error(f"Error saving LLM result cache: {str(e)}")
+
+llm_result_cache = LLMResultCache()
+atexit.register(llm_result_cache.save)
@@ -25,7 +25,8 @@ def load_document(source):
             if source.name.endswith(".txt"):
                 loader = TextLoader(tmp_file_path)
             elif source.name.endswith(".pdf"):
-                loader = PDFMinerLoader(tmp_file_path)
+                # One Document per page so chunks keep their page number
+                loader = PDFMinerLoader(tmp_file_path, concatenate_pages=False)
             elif source.name.endswith(".docx"):
                 loader = UnstructuredWordDocumentLoader(tmp_file_path)
             elif source.name.endswith(".csv"):
@@ -53,6 +54,9 @@ def load_document(source):
             result = loader.load()
             for doc in result:
                 doc.metadata.update(metadata)
+                if "page" in doc.metadata:
+                    # PDFMiner numbers pages from "0"; the self-query schema declares a 1-based integer
+                    doc.metadata["page"] = int(doc.metadata["page"]) + 1
                 if source.name.endswith('.md'):
                     # Extract URL source from markdown content
                     url_match = re.search(r'URL Source: (https?://\S+)', doc.page_content)
@@ -0,0 +1,158 @@
+import time
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import openai
+import tiktoken
+from config import (
+    OPENAI_API_KEY, OPENAI_BASE_URL, EMBEDDING_MODEL, EMBEDDING_BATCH_TOKENS, EMBEDDING_BATCH_SIZE,
+    EMBEDDING_CONCURRENCY, EMBEDDING_TOKENS_PER_MINUTE, EMBEDDING_MAX_RETRIES
+)
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def retry_after_seconds(error):
+    """Seconds from a Retry-After header, which may be a number or an HTTP date; None if absent or unparseable."""
+    retry_after = getattr(getattr(error, "response", None), "headers", {}).get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, tokens_per_minute):
+        self.rate = tokens_per_minute / 60.0
+        self.capacity = tokens_per_minute
+        self.tokens = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens):
+        # Oversized requests are clamped to the bucket size so they can still go through
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingScheduler:
+    """Embeds texts in token-bounded batches with bounded concurrency, rate limiting and retries."""
+
+    def __init__(self, model=EMBEDDING_MODEL, api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL,
+                 max_batch_tokens=EMBEDDING_BATCH_TOKENS, max_batch_size=EMBEDDING_BATCH_SIZE,
+                 concurrency=EMBEDDING_CONCURRENCY, tokens_per_minute=EMBEDDING_TOKENS_PER_MINUTE,
+                 max_retries=EMBEDDING_MAX_RETRIES):
+        self.model = model
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(tokens_per_minute)
+        self.encoding = None
+        self.stats_lock = threading.Lock()
+        self.total_tokens = 0
+        self.total_seconds = 0.0
+        self.requests = 0
+        self.retries = 0
+
+    def count_tokens(self, texts):
+        if self.encoding is None:
+            try:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                # Offline environments cannot download the BPE file; fall back to ~4 characters per token
+                logger.warning(f"Could not load tiktoken encoding, estimating token counts: {str(e)}")
+                self.encoding = False
+        if self.encoding:
+            return [len(tokens) for tokens in self.encoding.encode_batch(texts)]
+        return [len(text) // 4 + 1 for text in texts]
+
+    def pack_batches(self, texts):
+        batches, batch, batch_tokens = [], [], 0
+        for i, token_count in enumerate(self.count_tokens(texts)):
+            if batch and (batch_tokens + token_count > self.max_batch_tokens or len(batch) >= self.max_batch_size):
+                batches.append((batch, batch_tokens))
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += token_count
+        if batch:
+            batches.append((batch, batch_tokens))
+        return batches
+
+    def _request(self, texts, token_count):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire(token_count)
+            try:
+                response = self.client.embeddings.create(input=texts, model=self.model)
+                with self.stats_lock:
+                    self.requests += 1
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+                with self.stats_lock:
+                    self.retries += 1
+                logger.warning(f"Embedding request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def embed_query(self, text):
+        return self._request([text], self.count_tokens([text])[0])[0]
+
+    def embed(self, texts):
+        """Yield (indices, embeddings) per batch in completion order."""
+        batches = self.pack_batches(texts)
+        start = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = {
+                executor.submit(self._request, [texts[i] for i in indices], token_count): (indices, token_count)
+                for indices, token_count in batches
+            }
+            for future in as_completed(futures):
+                indices, token_count = futures[future]
+                embeddings = future.result()
+                with self.stats_lock:
+                    self.total_tokens += token_count
+                yield indices, embeddings
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            with self.stats_lock:
+                self.total_seconds += time.perf_counter() - start
+        logger.info(f"Embedding throughput: {self.stats()['tokens_per_second']:.0f} tokens/s")
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "tokens": self.total_tokens,
+                "seconds": self.total_seconds,
+                "tokens_per_second": self.total_tokens / self.total_seconds if self.total_seconds else 0.0,
+                "requests": self.requests,
+                "retries": self.retries,
+            }
+
+
+embedding_scheduler = EmbeddingScheduler()
@@ -1,7 +1,8 @@
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-import re
+from functools import lru_cache
 import logging
+from utils.tool_parsing import parse_loan_query, missing_fields
 
 logger = logging.getLogger(__name__)
 
@@ -10,45 +11,24 @@ class LoanDetails(BaseModel):
     rate: float | None = Field(None, description="Annual interest rate")
     tenure: float | None = Field(None, description="Loan tenure in years")
 
+LOAN_FIELD_LABELS = ["loan amount", "interest rate", "loan tenure"]
+
 def extract_loan_details(query: str) -> LoanDetails:
-    amount_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:k|thousand|lac|lakh|million|m)?\s*(?:rs\.?|rupees)?', query, re.IGNORECASE)
-    rate_match = re.search(r'(\d+(?:\.\d+)?)\s*%', query)
-    tenure_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:year|yr|y)', query, re.IGNORECASE)
-    
-    amount = float(amount_match.group(1)) if amount_match else None
-    rate = float(rate_match.group(1)) if rate_match else None
-    tenure = float(tenure_match.group(1)) if tenure_match else None
-    
+    amount, rate, tenure = parse_loan_query(query)
     return LoanDetails(amount=amount, rate=rate, tenure=tenure)
 
-class EMICalculator(BaseTool):
-    name = "EMI Calculator"
-    description = "Calculate EMI (Equated Monthly Installment) for a loan based on natural language input"
-
-    def _run(self, query: str) -> str:
-        loan_details = extract_loan_details(query)
-
-        if loan_details.amount is None or loan_details.rate is None or loan_details.tenure is None:
-            missing = []
-            if loan_details.amount is None:
-                missing.append("loan amount")
-            if loan_details.rate is None:
-                missing.append("interest rate")
-            if loan_details.tenure is None:
-                missing.append("loan tenure")
-            return f"I need more information. Please provide the {' and '.join(missing)}."
-
-        principal = loan_details.amount
-        annual_rate = loan_details.rate
-        time = loan_details.tenure
-
-        monthly_rate = annual_rate / (12 * 100)
-        time_in_months = time * 12
+@lru_cache(maxsize=4096)
+def emi_result(principal: float, annual_rate: float, time: float) -> str:
+    monthly_rate = annual_rate / (12 * 100)
+    time_in_months = time * 12
+    if monthly_rate == 0:
+        emi = principal / time_in_months
+    else:
         emi = (principal * monthly_rate * (1 + monthly_rate)**time_in_months) / ((1 + monthly_rate)**time_in_months - 1)
-        total_payment = emi * time_in_months
-        total_interest = total_payment - principal
-        
-        return f"""
+    total_payment = emi * time_in_months
+    total_interest = total_payment - principal
+    
+    return f"""
         Based on the provided information:
         Loan Amount: {principal}
         Annual Interest Rate: {annual_rate}%
@@ -59,6 +39,23 @@ class EMICalculator(BaseTool):
         Total interest you will pay: {round(total_interest, 2)}
         """
 
+def calculate_emi(query: str) -> str:
+    """Compute the EMI straight from the query text; used by chat and by EMICalculator._run."""
+    loan_details = parse_loan_query(query)
+    missing = missing_fields(loan_details, LOAN_FIELD_LABELS)
+    if missing:
+        return f"I need more information. Please provide the {' and '.join(missing)}."
+    if loan_details.tenure <= 0:
+        return "I need more information. Please provide the loan tenure."
+    return emi_result(*loan_details)
+
+class EMICalculator(BaseTool):
+    name = "EMI Calculator"
+    description = "Calculate EMI (Equated Monthly Installment) for a loan based on natural language input"
+
+    def _run(self, query: str) -> str:
+        return calculate_emi(query)
+
     async def _arun(self, query: str) -> str:
         raise NotImplementedError("EMICalculator does not support async")
 
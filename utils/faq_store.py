@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import logging
+import threading
+from collections import Counter
+from langchain.chains.question_answering import load_qa_chain
+from langchain.schema import Document
+from config import COLLECTIONS_FOLDER, FAQ_MATCH_THRESHOLD, FAQ_MAX_ENTRIES, FAQ_MIN_QUERY_COUNT
+from utils.cache import normalize_query
+from utils.quantized_index import index_only, query_index
+from utils.embedding_scheduler import embedding_scheduler
+
+logger = logging.getLogger(__name__)
+
+FAQ_FOLDER = os.path.join(COLLECTIONS_FOLDER, "faq")
+
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "do", "does", "i", "my", "me", "can", "could", "how", "what", "to", "of",
+    "for", "in", "on", "at", "and", "or", "please", "you", "your", "we", "our", "it", "be", "with", "tell", "about",
+}
+WORD = re.compile(r"[^\W_]+")
+QUESTION_LINE = re.compile(r"(?:^|[\n.!])\s*(?:Q[:.)]\s*|\d+[.)]\s*)?([A-Z][^\n?]{10,150}\?)")
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def query_terms(query):
+    return frozenset(word for word in WORD.findall(query.lower()) if word not in STOPWORDS)
+
+
+class FAQStore:
+    """Precomputed answers for recurring questions, served without retrieval or an LLM call."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        # Serializes writers so a slow save cannot replace the file after a newer one
+        self.save_lock = threading.Lock()
+        self.entries = {}
+        self.query_counts = Counter()
+        self.term_index = {}
+        self._pending_logs = 0
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                self.entries = data.get("entries", {})
+                self.query_counts = Counter(data.get("query_counts", {}))
+            except (OSError, ValueError, AttributeError) as e:
+                # The store is only a cache of answers; start empty rather than failing every lookup
+                logger.error(f"Error loading FAQ store {path}, starting empty: {str(e)}")
+                self.entries, self.query_counts = {}, Counter()
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        self.term_index = {}
+        for key in self.entries:
+            for term in query_terms(key):
+                self.term_index.setdefault(term, set()).add(key)
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        os.makedirs(folder, exist_ok=True)
+        with self.save_lock:
+            with self.lock:
+                # Copy under the lock; json.dump runs outside it while add and invalidate keep changing the dict
+                data = {"entries": dict(self.entries),
+                        "query_counts": dict(self.query_counts.most_common(FAQ_MAX_ENTRIES * 10))}
+                self._pending_logs = 0
+            fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+    def __len__(self):
+        return len(self.entries)
+
+    def lookup(self, query):
+        key = normalize_query(query)
+        with self.lock:
+            if key in self.entries:
+                return self.entries[key]
+            terms = query_terms(key)
+            if not terms:
+                return None
+            candidates = set().union(*(self.term_index.get(term, ()) for term in terms))
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                candidate_terms = query_terms(candidate)
+                score = len(terms & candidate_terms) / len(terms | candidate_terms)
+                if score > best_score:
+                    best, best_score = candidate, score
+            if best_score >= FAQ_MATCH_THRESHOLD:
+                return self.entries[best]
+        return None
+
+    def log_query(self, query):
+        with self.lock:
+            self.query_counts[normalize_query(query)] += 1
+            self._pending_logs += 1
+            should_save = self._pending_logs >= 50
+        if should_save:
+            self.save()
+
+    def add(self, question, answer, source_chunks):
+        with self.lock:
+            self.entries[normalize_query(question)] = {
+                "question": question,
+                "answer": answer,
+                "sources": source_chunks,
+                "created": time.time(),
+            }
+            self._rebuild_index()
+
+    def invalidate(self, collection):
+        """Drop entries whose source chunks were removed or changed since the answer was generated."""
+        with self.lock:
+            chunk_ids = sorted({chunk_id for entry in self.entries.values() for chunk_id in entry["sources"]})
+        if not chunk_ids:
+            return 0
+        current = collection.get(ids=chunk_ids, include=["documents"])
+        hashes = {chunk_id: content_hash(doc or "") for chunk_id, doc in zip(current["ids"], current["documents"])}
+        with self.lock:
+            stale = [
+                key for key, entry in self.entries.items()
+                if any(hashes.get(chunk_id) != digest for chunk_id, digest in entry["sources"].items())
+            ]
+            for key in stale:
+                del self.entries[key]
+            self._rebuild_index()
+        if stale:
+            logger.info(f"Invalidated {len(stale)} FAQ entries with changed sources")
+        return len(stale)
+
+    def mine_candidates(self, collection, limit):
+        """Questions asked repeatedly by users first, then questions written in the indexed documents."""
+        candidates = Counter()
+        with self.lock:
+            for query, count in self.query_counts.items():
+                if count >= FAQ_MIN_QUERY_COUNT:
+                    candidates[query] = count
+        total = collection.count()
+        for offset in range(0, total, 1000):
+            batch = collection.get(include=["documents"], limit=1000, offset=offset)
+            for doc in batch["documents"]:
+                for question in QUESTION_LINE.findall(doc or ""):
+                    candidates[question.strip()] += 1
+        seen, ordered = set(), []
+        for question, _ in candidates.most_common():
+            key = normalize_query(question)
+            if key not in seen and key not in self.entries:
+                seen.add(key)
+                ordered.append(question)
+        return ordered[:limit]
+
+
+def search_collection(collection, question, k):
+    if index_only(collection):
+        hits = query_index(collection, embedding_scheduler.embed_query(question), k=k)
+        return [hit[0] for hit in hits], [hit[1] for hit in hits], [hit[2] for hit in hits]
+    results = collection.query(query_texts=[question], n_results=k, include=["documents", "metadatas"])
+    return results["ids"][0], results["documents"][0], results["metadatas"][0]
+
+
+def generate_faq_entries(store, collection, llm, prompt, questions, k=4):
+    qa = load_qa_chain(llm, chain_type="stuff", prompt=prompt)
+    for question in questions:
+        try:
+            ids, docs, metadatas = search_collection(collection, question, k)
+            if not ids:
+                continue
+            documents = [Document(page_content=doc, metadata=meta or {}) for doc, meta in zip(docs, metadatas)]
+            answer = qa.invoke({"input_documents": documents, "question": question})["output_text"]
+            store.add(question, answer.strip(), {chunk_id: content_hash(doc) for chunk_id, doc in zip(ids, docs)})
+        except Exception as e:
+            logger.error(f"Error generating FAQ answer for '{question}': {str(e)}")
+
+
+def refresh_faq_store(collection, llm, prompt, limit=FAQ_MAX_ENTRIES):
+    """Invalidate stale answers, then mine and answer new candidate questions for the collection."""
+    try:
+        store = get_faq_store(collection.name)
+        store.invalidate(collection)
+        questions = store.mine_candidates(collection, max(limit - len(store), 0))
+        generate_faq_entries(store, collection, llm, prompt, questions)
+        store.save()
+        logger.info(f"FAQ store for {collection.name} holds {len(store)} answers")
+        return len(store)
+    except Exception as e:
+        logger.error(f"Error refreshing FAQ store: {str(e)}")
+        raise
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_faq_store(collection_name):
+    with _stores_lock:
+        if collection_name not in _stores:
+            _stores[collection_name] = FAQStore(os.path.join(FAQ_FOLDER, f"{collection_name}.json"))
+        return _stores[collection_name]
+
+
+def delete_faq_store(collection_name):
+    with _stores_lock:
+        _stores.pop(collection_name, None)
+        path = os.path.join(FAQ_FOLDER, f"{collection_name}.json")
+        if os.path.exists(path):
+            os.remove(path)
+            logger.info(f"Deleted FAQ store for collection: {collection_name}")
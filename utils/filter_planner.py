@@ -0,0 +1,112 @@
+import re
+import logging
+from utils.metadata_extractor import detect_product_categories, product_flag
+from utils.tool_parsing import CURRENCY_ALIASES, MAGNITUDES
+
+logger = logging.getLogger(__name__)
+
+# A four-digit number followed by a unit is an amount ("deposit of 2000 rupees"), not a year
+AMOUNT_UNITS = sorted({*CURRENCY_ALIASES, *MAGNITUDES, "rs", "units"}, key=len, reverse=True)
+NOT_AMOUNT = r"(?!\s*(?:[,.]\d|%|(?:" + "|".join(re.escape(unit) for unit in AMOUNT_UNITS) + r")(?!\w)))"
+YEAR_WORD = r"(?:the\s+)?(?:year|fy|fiscal\s+year)\s*"
+
+YEAR_CONSTRAINTS = [
+    (re.compile(rf"\b(?:since|after|from)\s+{YEAR_WORD}(\d{{4}})\b", re.IGNORECASE), lambda y: {"$gte": y * 10000 + 101}),
+    (re.compile(rf"\bsince\s+(\d{{4}})\b{NOT_AMOUNT}", re.IGNORECASE), lambda y: {"$gte": y * 10000 + 101}),
+    (re.compile(rf"\bbefore\s+(?:{YEAR_WORD})?(\d{{4}})\b{NOT_AMOUNT}", re.IGNORECASE), lambda y: {"$lt": y * 10000 + 101}),
+    (re.compile(rf"\b{YEAR_WORD}(\d{{4}})\b", re.IGNORECASE), None),
+    (re.compile(rf"\bin\s+(\d{{4}})\b{NOT_AMOUNT}", re.IGNORECASE), None),
+]
+
+
+def _year_clauses(query):
+    for pattern, bound in YEAR_CONSTRAINTS:
+        match = pattern.search(query)
+        if not match:
+            continue
+        year = int(match.group(1))
+        if not 1990 <= year <= 2100:
+            continue
+        if bound:
+            return [{"effective_date": bound(year)}]
+        return [
+            {"effective_date": {"$gte": year * 10000 + 101}},
+            {"effective_date": {"$lte": year * 10000 + 1231}},
+        ]
+    return []
+
+
+def merge_filters(*filters):
+    clauses = []
+    for where in filters:
+        if not where:
+            continue
+        clauses.extend(where["$and"] if list(where) == ["$and"] else [{key: value} for key, value in where.items()])
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def filter_fields(where):
+    fields = set()
+    for key, value in (where or {}).items():
+        if key in ("$and", "$or"):
+            for clause in value:
+                fields |= filter_fields(clause)
+        else:
+            fields.add(key)
+    return fields
+
+
+def widen_categories(where):
+    """Rewrite product_category equality into the per-category flags, so chunks about several products still match."""
+    if not where:
+        return where
+    widened = {}
+    for key, value in where.items():
+        if key in ("$and", "$or"):
+            widened[key] = [widen_categories(clause) for clause in value]
+        elif key != "product_category":
+            widened[key] = value
+        else:
+            condition = value if isinstance(value, dict) else {"$eq": value}
+            if "$eq" in condition:
+                widened[product_flag(condition["$eq"])] = True
+            elif "$in" in condition:
+                flags = [{product_flag(category): True} for category in condition["$in"]]
+                widened.update(flags[0] if len(flags) == 1 else {"$or": flags})
+            else:
+                widened[key] = value
+    return widened if len(widened) == 1 else {"$and": [{key: value} for key, value in widened.items()]}
+
+
+def plan_filter(query, collection=None, structured_filter=None):
+    """Turn constraints found in the query, plus the self-query retriever's filter, into a Chroma where clause.
+
+    The self-query filter wins for any field it sets. A keyword-detected
+    product only becomes a filter when the query names exactly one product
+    category, and a year needs temporal wording ("since 2022", "in the year
+    2023"). When a collection is given, the filter is dropped if it matches
+    no chunks, so collections ingested before metadata enrichment still
+    answer every query.
+    """
+    fields = filter_fields(structured_filter)
+    clauses = []
+    if "product_category" not in fields:
+        categories = detect_product_categories(query)
+        if len(categories) == 1:
+            clauses.append({product_flag(categories[0]): True})
+    if "effective_date" not in fields:
+        clauses.extend(_year_clauses(query))
+    where = merge_filters(widen_categories(structured_filter), *clauses)
+
+    if where and collection is not None:
+        try:
+            if not collection.get(where=where, limit=1, include=[])["ids"]:
+                logger.debug(f"Filter {where} matches no chunks, searching the whole collection")
+                return None
+        except Exception as e:
+            logger.error(f"Error checking filter {where}: {str(e)}")
+            return None
+    logger.debug(f"Planned filter for query: {where}")
+    return where
@@ -1,12 +1,17 @@
 import json
+import os
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-import re
+from functools import lru_cache
 import logging
 from typing import Dict, List
+from config import DATA_FOLDER
+from utils.tool_parsing import CURRENCY_MAPPING, parse_forex_query, missing_fields
 
 logger = logging.getLogger(__name__)
 
+EXCHANGE_RATES_PATH = os.path.join(DATA_FOLDER, "exchange_rates.json")
+
 class ForexDetails(BaseModel):
     amount: float | None = Field(None, description="Amount to convert")
     from_currency: str | None = Field(None, description="Currency to convert from")
@@ -31,35 +36,12 @@ class ForexConverter(BaseTool):
 
 
     def load_currency_data(self) -> Dict[str, Dict]:
-        with open('src/data/exchange_rates.json', 'r') as f:
+        with open(EXCHANGE_RATES_PATH, 'r') as f:
             data = json.load(f)
         return {item['Currency']: item for item in data}
 
     def load_currency_mapping(self) -> Dict[str, List[str]]:
-        return {
-            "USD": ["US Dollar", "Dollar","dollars","$", "USD"],
-            "EUR": ["Euro", "€", "EUR"],
-            "GBP": ["British Pound", "Pound Sterling", "£", "GBP"],
-            "CHF": ["Swiss Franc", "CHF"],
-            "AUD": ["Australian Dollar", "AUD"],
-            "CAD": ["Canadian Dollar", "CAD"],
-            "SGD": ["Singapore Dollar", "SGD"],
-            "JPY": ["Japanese Yen", "Yen", "¥", "JPY"],
-            "CNY": ["Chinese Yuan", "Renminbi", "¥", "CNY"],
-            "HKD": ["Hongkong Dollar", "HKD"],
-            "DKK": ["Danish Kroner", "DKK"],
-            "MYR": ["Malaysian Ringgit", "MYR"],
-            "QAR": ["Qatari Riyal", "QAR"],
-            "SAR": ["Saudi Rial", "SAR"],
-            "SEK": ["Swedish Kroner", "SEK"],
-            "THB": ["Thai Bhat", "THB"],
-            "AED": ["UAE Dirham", "AED"],
-            "KWD": ["Kuwaiti Dinar", "KWD"],
-            "BHD": ["Bahrain Dinar", "BHD"],
-            "KRW": ["Korean Won", "KRW"],
-            "INR": ["Indian Rupees", "₹", "INR", "Rupees"],
-            "NPR": ["Nepali Rupees", "NPR", "रू", "Nepalese Rupee","nrs"],
-        }
+        return CURRENCY_MAPPING
     
     def load_unit_mapping(self) -> Dict[str, int]:
         return {
@@ -103,40 +85,26 @@ class ForexConverter(BaseTool):
 
 
     def extract_forex_details(self, query: str) -> ForexDetails:
-        amount_match = re.search(r'(\d+(?:\.\d+)?)\s*(?:k|thousand|million|m)?', query, re.IGNORECASE)
-        from_currency_match = re.search(r'(\w+)\s+to', query, re.IGNORECASE)
-        to_currency_match = re.search(r'to\s+(\w+)', query, re.IGNORECASE)
-        
-        amount = float(amount_match.group(1)) if amount_match else None
-        from_currency = self.get_currency_code(from_currency_match.group(1)) if from_currency_match else None
-        to_currency = self.get_currency_code(to_currency_match.group(1)) if to_currency_match else None
-        
+        amount, from_currency, to_currency = parse_forex_query(query)
         return ForexDetails(amount=amount, from_currency=from_currency, to_currency=to_currency)
 
+    def _run(self, query: str) -> str:
+        return convert_forex(query)
 
+    async def _arun(self, query: str) -> str:
+        raise NotImplementedError("ForexConverter does not support async")
 
-    def _run(self, query: str) -> str:
-        forex_details = self.extract_forex_details(query)
-
-        if forex_details.amount is None or forex_details.from_currency is None or forex_details.to_currency is None:
-            missing = []
-            if forex_details.amount is None:
-                missing.append("amount")
-            if forex_details.from_currency is None:
-                missing.append("source currency")
-            if forex_details.to_currency is None:
-                missing.append("target currency")
-            return f"I need more information. Please provide the {' and '.join(missing)}."
-
-        amount = forex_details.amount
-        from_currency = forex_details.from_currency
-        to_currency = forex_details.to_currency
-
-        try:
-            rate = self.get_exchange_rate(from_currency, to_currency)
-            converted_amount = amount * rate
-            
-            return f"""
+forex_tool = ForexConverter()
+
+FOREX_FIELD_LABELS = ["amount", "source currency", "target currency"]
+
+@lru_cache(maxsize=4096)
+def conversion_result(amount: float, from_currency: str, to_currency: str) -> str:
+    try:
+        rate = forex_tool.get_exchange_rate(from_currency, to_currency)
+        converted_amount = amount * rate
+        
+        return f"""
             Based on the provided information:
             Amount: {amount} {from_currency}
             From: {from_currency}
@@ -145,11 +113,14 @@ class ForexConverter(BaseTool):
             
             Converted amount: {round(converted_amount, 2)} {to_currency}
             """
-        except KeyError:
-            return f"Sorry, I don't have exchange rate information for {from_currency} or {to_currency}."
-
-    async def _arun(self, query: str) -> str:
-        raise NotImplementedError("ForexConverter does not support async")
-
-forex_tool = ForexConverter()
+    except KeyError:
+        return f"Sorry, I don't have exchange rate information for {from_currency} or {to_currency}."
+
+def convert_forex(query: str) -> str:
+    """Convert straight from the query text, reporting which of amount and currencies are missing."""
+    forex_details = parse_forex_query(query)
+    missing = missing_fields(forex_details, FOREX_FIELD_LABELS)
+    if missing:
+        return f"I need more information. Please provide the {' and '.join(missing)}."
+    return conversion_result(*forex_details)
 
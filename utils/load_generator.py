@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import random
+import logging
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from utils.process_stats import process_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+# Resolved against config.DATA_FOLDER only after the stub URL is set, since importing config reads it
+QUERY_MIX_FILE = "load_test_queries.json"
+
+
+def load_query_mix(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def session_queries(query_mix, count, seed):
+    """Replayable query sequence for one simulated session."""
+    rng = random.Random(seed)
+    return rng.choices(query_mix, weights=[item.get("weight", 1) for item in query_mix], k=count)
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RSSSampler:
+    """Samples current RSS in the background; ru_maxrss is a lifetime peak and cannot separate levels."""
+
+    def __init__(self, interval=0.1):
+        self.interval = interval
+        self.samples = []
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.samples.append(process_rss_bytes())
+            if self.stopped.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.samples.append(process_rss_bytes())
+
+
+def _run_level(session, concurrency):
+    cpu_before = _cpu_seconds()
+    start = time.perf_counter()
+    with RSSSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = [sample for result in executor.map(session, range(concurrency)) for sample in result]
+    return _summarize(samples, concurrency, time.perf_counter() - start, _cpu_seconds() - cpu_before, rss.samples)
+
+
+def _summarize(samples, concurrency, elapsed, cpu_seconds, rss_samples):
+    latencies = np.array([sample["latency"] for sample in samples]) * 1000
+    errors = sum(1 for sample in samples if sample["error"])
+    report = {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "cpu_seconds": cpu_seconds,
+        "cpu_utilization": cpu_seconds / elapsed if elapsed else 0.0,
+        "rss_mb": rss_samples[-1] / 2 ** 20,
+        "peak_rss_mb": max(rss_samples) / 2 ** 20,
+        "threads": threading.active_count(),
+    }
+    kinds = {sample["kind"] for sample in samples}
+    report["p95_ms_by_kind"] = {
+        kind: float(np.percentile([s["latency"] * 1000 for s in samples if s["kind"] == kind], 95)) for kind in sorted(kinds)
+    }
+    return report
+
+
+def run_chat_level(process_query, make_llm, make_memory, error_response, query_mix, concurrency, requests_per_session, seed=0):
+    def session(session_id):
+        llm, memory = make_llm(), make_memory()
+        samples = []
+        for item in session_queries(query_mix, requests_per_session, seed * 100003 + session_id):
+            start = time.perf_counter()
+            try:
+                error = process_query(llm, item["query"], memory) == error_response
+            except Exception as e:
+                logger.error(f"Session {session_id} failed: {str(e)}")
+                error = True
+            samples.append({"kind": item["kind"], "latency": time.perf_counter() - start, "error": error})
+        return samples
+
+    return _run_level(session, concurrency)
+
+
+def run_ingest_level(add_texts, concurrency, docs_per_session, chunks_per_doc, seed=0):
+    def session(session_id):
+        rng = random.Random(seed * 100003 + session_id)
+        samples = []
+        for doc in range(docs_per_session):
+            source = f"loadtest_{seed}_{session_id}_{doc}.txt"
+            texts = [
+                f"{source} section {i}: " + " ".join(rng.choice(["loan", "deposit", "card", "account", "branch", "interest", "fee"]) for _ in range(150))
+                for i in range(chunks_per_doc)
+            ]
+            start = time.perf_counter()
+            try:
+                add_texts(texts, [{"source": source} for _ in texts])
+                error = False
+            except Exception as e:
+                logger.error(f"Ingest session {session_id} failed: {str(e)}")
+                error = True
+            samples.append({"kind": "ingest", "latency": time.perf_counter() - start, "error": error})
+        return samples
+
+    report = _run_level(session, concurrency)
+    report["chunks_per_second"] = report["throughput_rps"] * chunks_per_doc
+    return report
+
+
+def print_report(title, reports):
+    print(f"\n{title}")
+    print(f"{'conc':>5} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err %':>6} {'cpu %':>6} {'rss MB':>8} {'peak MB':>8}")
+    for r in reports:
+        print(f"{r['concurrency']:>5} {r['requests']:>6} {r['throughput_rps']:>8.2f} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} "
+              f"{r['p99_ms']:>9.0f} {r['error_rate'] * 100:>6.1f} {r['cpu_utilization'] * 100:>6.0f} {r['rss_mb']:>8.0f} {r['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concurrent load test for chat.process_query and ingestion")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrent session counts")
+    parser.add_argument("--requests-per-session", type=int, default=10)
+    parser.add_argument("--collection", default="loadtest")
+    parser.add_argument("--queries", help=f"JSON query mix with kind, weight and query (default: {QUERY_MIX_FILE} in DATA_FOLDER)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ingest-docs", type=int, default=0, help="Documents per session for the ingestion stage")
+    parser.add_argument("--chunks-per-doc", type=int, default=20)
+    parser.add_argument("--stub", action="store_true", help="Run against an in-process stub of the OpenAI API")
+    parser.add_argument("--stub-chat-latency", type=float, default=0.3)
+    parser.add_argument("--stub-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--stub-embedding-latency", type=float, default=0.05)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--trace", action="store_true", help="Keep LangSmith tracing on (off by default, and always off with --stub)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.stub:
+        from utils.stub_openai import start_stub_server
+        _, base_url = start_stub_server(latency=args.stub_embedding_latency, chat_latency=args.stub_chat_latency,
+                                        tokens_per_second=args.stub_tokens_per_second)
+        # Must be set before config is imported so every client picks up the stub
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from config import DATA_FOLDER
+    # config switches LangSmith tracing on; load-test traffic should not be uploaded or pay for the uploads
+    if args.stub or not args.trace:
+        os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    from langchain_openai import ChatOpenAI
+    from langchain.memory import ConversationBufferMemory
+    import chat
+    from utils.vector_store import add_texts_to_collection, list_collections, create_collection, select_collection
+
+    if args.collection in list_collections():
+        select_collection(args.collection)
+    else:
+        create_collection(args.collection)
+
+    levels = [int(level) for level in args.levels.split(",")]
+    results = {"collection": args.collection, "seed": args.seed, "ingest": [], "chat": []}
+
+    if args.ingest_docs:
+        for concurrency in levels:
+            results["ingest"].append(run_ingest_level(add_texts_to_collection, concurrency, args.ingest_docs,
+                                                      args.chunks_per_doc, seed=args.seed))
+        print_report("Ingestion (per document)", results["ingest"])
+
+    query_mix = load_query_mix(args.queries or os.path.join(DATA_FOLDER, QUERY_MIX_FILE))
+    for concurrency in levels:
+        results["chat"].append(run_chat_level(
+            chat.process_query,
+            lambda: ChatOpenAI(temperature=0),
+            lambda: ConversationBufferMemory(return_messages=True, memory_key="chat_history"),
+            chat.ERROR_RESPONSE, query_mix, concurrency, args.requests_per_session, seed=args.seed
+        ))
+    print_report("Chat (per query)", results["chat"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
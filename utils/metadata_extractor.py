@@ -0,0 +1,147 @@
+import os
+import re
+import logging
+from datetime import datetime
+from numbers import Integral, Real
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_KEYWORDS = {
+    "loan": ["loan", "emi", "mortgage", "home loan", "auto loan", "overdraft", "collateral", "installment"],
+    "deposit": ["fixed deposit", "deposit", "saving", "savings", "recurring deposit"],
+    "card": ["card", "debit card", "credit card", "visa", "mastercard", "atm"],
+    "account": ["account opening", "account", "kyc", "current account", "minimum balance"],
+    "remittance": ["remit", "remittance", "swift", "transfer"],
+    "forex": ["forex", "exchange rate", "currency", "currencies", "foreign exchange"],
+    "digital_banking": ["mobile banking", "internet banking", "online banking", "app", "qr"],
+}
+
+DOCUMENT_TYPES = {
+    ".pdf": "pdf",
+    ".docx": "docx",
+    ".csv": "csv",
+    ".md": "markdown",
+    ".json": "json",
+    ".txt": "text",
+}
+# One record per Document; a date in one row says nothing about the others
+ROW_BASED_TYPES = {"csv", "json"}
+
+MONTHS = "jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|jun(?:e)?|jul(?:y)?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?"
+DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})\b"), lambda m: (m.group(1), m.group(2), m.group(3))),
+    (re.compile(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({MONTHS}),?\s+(\d{{4}})\b", re.IGNORECASE), lambda m: (m.group(3), m.group(2), m.group(1))),
+    (re.compile(rf"\b({MONTHS})\s+(\d{{1,2}})(?:st|nd|rd|th)?,?\s+(\d{{4}})\b", re.IGNORECASE), lambda m: (m.group(3), m.group(1), m.group(2))),
+]
+EFFECTIVE_MARKER = re.compile(r"effective|w\.?e\.?f|with effect from|valid from|dated", re.IGNORECASE)
+DEVANAGARI = re.compile(r"[ऀ-ॿ]")
+LETTER = re.compile(r"[^\W\d_]")
+
+# Loader metadata worth keeping in Chroma; everything else (temp file paths, etc.) is dropped
+PASSTHROUGH_FIELDS = ["filename", "file_type", "url_source", "source_url", "row_index", "page"]
+
+
+def _keyword_pattern(keywords):
+    # Plural forms match too: "loans", "cards", "mortgages"
+    return re.compile(r"\b(?:" + "|".join(re.escape(k) for k in sorted(keywords, key=len, reverse=True)) + r")(?:e?s)?\b", re.IGNORECASE)
+
+
+PRODUCT_PATTERNS = {category: _keyword_pattern(keywords) for category, keywords in PRODUCT_KEYWORDS.items()}
+
+
+def product_flag(category):
+    """Boolean metadata key set on every chunk that mentions the category (Chroma has no list values)."""
+    return f"product_{category}"
+
+
+def detect_product_categories(text):
+    """Every product category the text mentions, most-mentioned first."""
+    counts = {category: len(pattern.findall(text)) for category, pattern in PRODUCT_PATTERNS.items()}
+    return [category for category, hits in sorted(counts.items(), key=lambda item: -item[1]) if hits]
+
+
+def detect_product_category(text):
+    categories = detect_product_categories(text)
+    return categories[0] if categories else None
+
+
+def _to_date_int(year, month, day):
+    month = int(month) if str(month).isdigit() else datetime.strptime(month[:3].title(), "%b").month
+    try:
+        return int(datetime(int(year), month, int(day)).strftime("%Y%m%d"))
+    except ValueError:
+        return None
+
+
+def extract_effective_date(text, marked_only=False):
+    """Return the document's effective date as an int YYYYMMDD, preferring dates next to an 'effective' marker.
+
+    With marked_only, dates that no marker points at are ignored.
+    """
+    found = []
+    for pattern, parts in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            value = _to_date_int(*parts(match))
+            if value:
+                found.append((match.start(), value))
+    if not found:
+        return None
+    for marker in EFFECTIVE_MARKER.finditer(text):
+        nearby = [(start - marker.end(), value) for start, value in found if 0 <= start - marker.end() <= 40]
+        if nearby:
+            return min(nearby)[1]
+    return None if marked_only else min(found)[1]
+
+
+def detect_language(text):
+    letters = len(LETTER.findall(text))
+    if not letters:
+        return None
+    return "ne" if len(DEVANAGARI.findall(text)) / letters > 0.3 else "en"
+
+
+def detect_document_type(source_name, metadata):
+    if metadata.get("source_url"):
+        return "web"
+    return DOCUMENT_TYPES.get(os.path.splitext(source_name)[1].lower(), "other")
+
+
+def _clean(value):
+    if isinstance(value, bool) or isinstance(value, str):
+        return value
+    if isinstance(value, Integral):
+        return int(value)
+    if isinstance(value, Real):
+        return float(value)
+    return None
+
+
+def enrich_metadata(text, source_name, metadata=None, document_date=None):
+    metadata = metadata or {}
+    enriched = {field: _clean(metadata.get(field)) for field in PASSTHROUGH_FIELDS}
+    categories = detect_product_categories(text)
+    enriched.update({product_flag(category): True for category in categories})
+    enriched.update({
+        "source": source_name,
+        "document_type": detect_document_type(source_name, metadata),
+        "product_category": categories[0] if categories else None,
+        # A date the chunk itself marks as effective beats the one found for the whole document
+        "effective_date": extract_effective_date(text, marked_only=True) or document_date or extract_effective_date(text),
+        "language": detect_language(text),
+    })
+    # Chroma only accepts str/int/float/bool values
+    return {key: value for key, value in enriched.items() if value is not None}
+
+
+def build_chunk_metadatas(chunks, source_name, documents=None):
+    """Build Chroma metadata for split chunks, inheriting the effective date found in the whole document.
+
+    CSV and JSON files hold one record per row, so their chunks only carry
+    dates found in their own row.
+    """
+    document_text = " ".join(doc.page_content for doc in documents or [])
+    row_based = detect_document_type(source_name, {}) in ROW_BASED_TYPES
+    document_date = extract_effective_date(document_text) if document_text and not row_based else None
+    metadatas = [enrich_metadata(chunk.page_content, source_name, chunk.metadata, document_date) for chunk in chunks]
+    logger.debug(f"Extracted metadata for {len(metadatas)} chunks of {source_name}")
+    return metadatas
@@ -0,0 +1,10 @@
+import os
+
+
+def process_rss_bytes():
+    """Current resident set size of the whole process, 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
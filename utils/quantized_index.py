@@ -0,0 +1,519 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from typing import NamedTuple, Optional
+import numpy as np
+from config import (
+    COLLECTIONS_FOLDER, VECTOR_BACKEND, QUANTIZATION, PQ_SUBSPACES, PQ_MIN_TRAIN, IVF_NLIST, IVF_NPROBE,
+    RERANK_CANDIDATES
+)
+from utils.process_stats import process_rss_bytes
+
+logger = logging.getLogger(__name__)
+
+INDEX_FOLDER = os.path.join(COLLECTIONS_FOLDER, "quantized")
+
+# Chroma always builds an HNSW graph, so index-only collections give it a 1-dim stand-in instead of the real vector
+PLACEHOLDER_EMBEDDING = [0.0]
+ENCODE_BLOCK = 10000
+TRAIN_SAMPLES_PER_CENTROID = 64
+
+
+def index_only(collection):
+    """Collections created with VECTOR_BACKEND=quantized keep their vectors only in the quantized index."""
+    return (collection.metadata or {}).get("vector_backend") == "quantized"
+
+
+def uses_quantized_index(collection):
+    return VECTOR_BACKEND == "quantized" or index_only(collection)
+
+
+def searches_quantized_index(collection):
+    """Whether queries can go to the quantized index; collections that predate it keep searching Chroma until backfilled."""
+    if index_only(collection):
+        return True
+    if VECTOR_BACKEND != "quantized":
+        return False
+    indexed, stored = len(get_quantized_index(collection.name)), collection.count()
+    if indexed < stored:
+        logger.warning(f"Quantized index for {collection.name} covers {indexed} of {stored} chunks, searching Chroma "
+                       f"instead; backfill it with python -m utils.quantized_index {collection.name}")
+        return False
+    return True
+
+
+def _kmeans(data, n_clusters, n_iter=20, seed=0):
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, len(data))
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2 * data @ centroids.T
+            + (centroids ** 2).sum(axis=1)
+        )
+        assignment = distances.argmin(axis=1)
+        for c in range(n_clusters):
+            members = data[assignment == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids.astype(np.float32)
+
+
+def _sample_rows(vectors, limit, seed):
+    if len(vectors) <= limit:
+        return np.asarray(vectors)
+    rows = np.sort(np.random.default_rng(seed).choice(len(vectors), limit, replace=False))
+    return np.asarray(vectors[rows])
+
+
+def _encode(vectors, codec, codebooks):
+    if codec == "pq":
+        m, k, sub = codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for i in range(m):
+            chunk = vectors[:, i * sub:(i + 1) * sub]
+            distances = (chunk ** 2).sum(axis=1, keepdims=True) - 2 * chunk @ codebooks[i].T + (codebooks[i] ** 2).sum(axis=1)
+            codes[:, i] = distances.argmin(axis=1)
+        return codes, None
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _assign(vectors, centroids):
+    return (vectors @ centroids.T).argmax(axis=1).astype(np.int32)
+
+
+class IndexView(NamedTuple):
+    """Immutable state a search works against; writers publish a new view instead of mutating this one."""
+    count: int
+    ids: list
+    live: Optional[np.ndarray]
+    codec: str
+    codes: Optional[np.ndarray]
+    scales: Optional[np.ndarray]
+    vectors: Optional[np.ndarray]
+    codebooks: Optional[np.ndarray]
+    centroids: Optional[np.ndarray]
+    assignment: Optional[np.ndarray]
+
+
+class QuantizedIndex:
+    """Memory-mapped vector index with int8 or product-quantized codes.
+
+    Full float32 vectors live in an on-disk memmap that is only touched to
+    re-rank the best candidates; the scan itself runs over the compact codes.
+    PQ codebooks and IVF centroids are (re)trained whenever the index has
+    doubled since they were last trained; until PQ has enough data to train
+    on, the index scans int8 codes.
+    """
+
+    def __init__(self, path, quantization=QUANTIZATION, pq_subspaces=PQ_SUBSPACES, pq_min_train=PQ_MIN_TRAIN,
+                 nlist=IVF_NLIST, nprobe=IVF_NPROBE):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        else:
+            self.meta = {
+                "dim": None,
+                "count": 0,
+                "quantization": quantization,
+                "pq_subspaces": pq_subspaces,
+                "nlist": nlist,
+                "nprobe": nprobe,
+            }
+        self.codebooks = self._load_array("pq_codebooks.npy")
+        self.centroids = self._load_array("ivf_centroids.npy")
+        # Indexes written before retraining existed trained both structures once, on their first batch
+        self.meta.setdefault("codec", "pq" if self.codebooks is not None else "int8")
+        self.meta.setdefault("pq_min_train", pq_min_train)
+        self.meta.setdefault("pq_trained_count", 0)
+        self.meta.setdefault("ivf_trained_count", 0)
+
+        count = self.meta["count"]
+        self.ids = []
+        ids_path = os.path.join(path, "ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path) as f:
+                self.ids = [line.rstrip("\n") for line in f][:count]
+        self.live = self._load_array("live.npy")
+        if self.live is not None:
+            self.live = np.concatenate([self.live[:count], np.ones(max(count - len(self.live), 0), dtype=bool)])
+        self.rows = {doc_id: row for row, doc_id in enumerate(self.ids) if self.live is None or self.live[row]}
+        self._discard_partial_writes()
+        self._publish()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load_array(self, name):
+        return np.load(self._file(name)) if os.path.exists(self._file(name)) else None
+
+    def _row_bytes(self):
+        dim = self.meta["dim"] or 0
+        code_width = self.meta["pq_subspaces"] if self.meta["codec"] == "pq" else dim
+        return {
+            "vectors.bin": dim * 4,
+            "codes.bin": code_width,
+            "scales.bin": 4 if self.meta["codec"] == "int8" else 0,
+            "ivf_assignment.bin": 4 if self.centroids is not None else 0,
+        }
+
+    def _discard_partial_writes(self):
+        """Cut every file back to the committed row count so an interrupted add cannot misalign later rows."""
+        count = self.meta["count"]
+        for name, row_bytes in self._row_bytes().items():
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > count * row_bytes:
+                os.truncate(path, count * row_bytes)
+        ids_path = self._file("ids.txt")
+        if os.path.exists(ids_path):
+            with open(ids_path) as f:
+                line_count = sum(1 for _ in f)
+            if line_count != count:
+                with open(ids_path, "w") as f:
+                    f.writelines(f"{i}\n" for i in self.ids)
+
+    def _memmap(self, name, dtype, width, count):
+        if count == 0:
+            return None
+        shape = (count, width) if width else (count,)
+        return np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape)
+
+    def _publish(self):
+        count, dim = self.meta["count"], self.meta["dim"]
+        if self.meta["codec"] == "pq":
+            codes = self._memmap("codes.bin", np.uint8, self.meta["pq_subspaces"], count)
+            scales = None
+        else:
+            codes = self._memmap("codes.bin", np.int8, dim, count)
+            scales = self._memmap("scales.bin", np.float32, None, count)
+        self.view = IndexView(
+            count=count,
+            ids=self.ids,
+            live=self.live,
+            codec=self.meta["codec"],
+            codes=codes,
+            scales=scales,
+            vectors=self._memmap("vectors.bin", np.float32, dim, count),
+            codebooks=self.codebooks,
+            centroids=self.centroids,
+            assignment=self._memmap("ivf_assignment.bin", np.int32, None, count) if self.centroids is not None else None,
+        )
+
+    def _save_meta(self):
+        with open(self._file("meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    def _save_live(self, live):
+        with open(self._file("live.npy.tmp"), "wb") as f:
+            np.save(f, live)
+        os.replace(self._file("live.npy.tmp"), self._file("live.npy"))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def contains(self, ids):
+        with self.lock:
+            return {doc_id for doc_id in ids if doc_id in self.rows}
+
+    def _retrain(self, count):
+        """Train PQ and IVF once there is enough data and again whenever the index doubles; re-encodes every row."""
+        meta = self.meta
+        train_pq = (meta["quantization"] == "pq" and count >= meta["pq_min_train"]
+                    and count >= 2 * meta["pq_trained_count"])
+        train_ivf = bool(meta["nlist"]) and count >= meta["nlist"] and count >= 2 * meta["ivf_trained_count"]
+        if not (train_pq or train_ivf):
+            return False
+
+        vectors = np.memmap(self._file("vectors.bin"), dtype=np.float32, mode="r", shape=(count, meta["dim"]))
+        codec, codebooks, centroids = meta["codec"], self.codebooks, self.centroids
+        if train_pq:
+            m = meta["pq_subspaces"]
+            sub = meta["dim"] // m
+            sample = _sample_rows(vectors, 256 * TRAIN_SAMPLES_PER_CENTROID, count)
+            codebooks = np.stack([_kmeans(sample[:, i * sub:(i + 1) * sub], 256) for i in range(m)])
+            codec = "pq"
+        if train_ivf:
+            centroids = _kmeans(_sample_rows(vectors, meta["nlist"] * TRAIN_SAMPLES_PER_CENTROID, count), meta["nlist"])
+
+        # Write complete replacements first; open memmaps of older views keep the files they were created from
+        with open(self._file("codes.bin.tmp"), "wb") as codes_file, \
+                open(self._file("scales.bin.tmp"), "wb") as scales_file, \
+                open(self._file("ivf_assignment.bin.tmp"), "wb") as assignment_file:
+            for start in range(0, count, ENCODE_BLOCK):
+                block = np.asarray(vectors[start:start + ENCODE_BLOCK])
+                codes, scales = _encode(block, codec, codebooks)
+                codes_file.write(codes.tobytes())
+                if scales is not None:
+                    scales_file.write(scales.tobytes())
+                if centroids is not None:
+                    assignment_file.write(_assign(block, centroids).tobytes())
+        os.replace(self._file("codes.bin.tmp"), self._file("codes.bin"))
+        if codec == "int8":
+            os.replace(self._file("scales.bin.tmp"), self._file("scales.bin"))
+        else:
+            os.remove(self._file("scales.bin.tmp"))
+            if os.path.exists(self._file("scales.bin")):
+                os.remove(self._file("scales.bin"))
+        if centroids is not None:
+            os.replace(self._file("ivf_assignment.bin.tmp"), self._file("ivf_assignment.bin"))
+        else:
+            os.remove(self._file("ivf_assignment.bin.tmp"))
+
+        if train_pq:
+            np.save(self._file("pq_codebooks.npy"), codebooks)
+            meta["pq_trained_count"] = count
+        if train_ivf:
+            np.save(self._file("ivf_centroids.npy"), centroids)
+            meta["ivf_trained_count"] = count
+        meta["codec"], self.codebooks, self.centroids = codec, codebooks, centroids
+        logger.info(f"Trained quantized index at {self.path} on {count} vectors (pq={train_pq}, ivf={train_ivf})")
+        return True
+
+    def add(self, ids, embeddings):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        with self.lock:
+            if self.meta["dim"] is None:
+                if self.meta["quantization"] == "pq" and vectors.shape[1] % self.meta["pq_subspaces"]:
+                    raise ValueError(f"Dimension {vectors.shape[1]} is not divisible by {self.meta['pq_subspaces']} PQ subspaces")
+                self.meta["dim"] = vectors.shape[1]
+            elif vectors.shape[1] != self.meta["dim"]:
+                raise ValueError(f"Expected {self.meta['dim']}-dim vectors, got {vectors.shape[1]}")
+            start = self.meta["count"]
+            count = start + len(ids)
+            try:
+                with open(self._file("vectors.bin"), "ab") as f:
+                    f.write(vectors.tobytes())
+                if not self._retrain(count):
+                    codes, scales = _encode(vectors, self.meta["codec"], self.codebooks)
+                    with open(self._file("codes.bin"), "ab") as f:
+                        f.write(codes.tobytes())
+                    if scales is not None:
+                        with open(self._file("scales.bin"), "ab") as f:
+                            f.write(scales.tobytes())
+                    if self.centroids is not None:
+                        with open(self._file("ivf_assignment.bin"), "ab") as f:
+                            f.write(_assign(vectors, self.centroids).tobytes())
+                with open(self._file("ids.txt"), "a") as f:
+                    f.writelines(f"{i}\n" for i in ids)
+            except Exception:
+                self._discard_partial_writes()
+                raise
+
+            # Re-adding an id replaces its earlier row
+            replaced = [self.rows[doc_id] for doc_id in ids if doc_id in self.rows]
+            if replaced or self.live is not None:
+                live = np.ones(count, dtype=bool)
+                if self.live is not None:
+                    live[:start] = self.live
+                live[replaced] = False
+                if replaced:
+                    self._save_live(live)
+                self.live = live
+            self.ids.extend(ids)
+            self.rows.update((doc_id, start + i) for i, doc_id in enumerate(ids))
+            self.meta["count"] = count
+            self._save_meta()
+            self._publish()
+        logger.info(f"Added {len(ids)} vectors to quantized index at {self.path}")
+
+    def get_vectors(self, ids):
+        with self.lock:
+            rows = [self.rows[doc_id] for doc_id in ids]
+            view = self.view
+        return np.asarray(view.vectors[rows]) if rows else np.empty((0, self.meta["dim"] or 0), dtype=np.float32)
+
+    def delete(self, ids):
+        """Tombstone rows so searches skip them; the vectors stay on disk."""
+        with self.lock:
+            rows = [self.rows.pop(doc_id) for doc_id in ids if doc_id in self.rows]
+            if rows:
+                live = np.ones(self.meta["count"], dtype=bool) if self.live is None else self.live.copy()
+                live[rows] = False
+                self._save_live(live)
+                self.live = live
+                self._publish()
+        if rows:
+            logger.info(f"Deleted {len(rows)} vectors from quantized index at {self.path}")
+        return len(rows)
+
+    def _candidate_rows(self, view, query):
+        if view.centroids is None or view.assignment is None:
+            return np.arange(view.count)
+        nprobe = min(self.meta["nprobe"], len(view.centroids))
+        lists = np.argsort(-(view.centroids @ query))[:nprobe]
+        return np.flatnonzero(np.isin(view.assignment, lists))
+
+    def _approximate_scores(self, view, query, rows):
+        if view.codec == "pq":
+            m, k, sub = view.codebooks.shape
+            table = np.einsum("mks,ms->mk", view.codebooks, query.reshape(m, sub))
+            codes = view.codes[rows]
+            return table[np.arange(m), codes].sum(axis=1)
+        return (view.codes[rows].astype(np.float32) @ query) * view.scales[rows]
+
+    def search(self, query_embedding, k=4, rerank_candidates=RERANK_CANDIDATES, ids=None):
+        """Top-k (id, score) pairs; pass ids to search only those rows, e.g. the chunks matching a metadata filter."""
+        # Read the published view once so a concurrent add or delete cannot change the row count mid-search
+        view = self.view
+        if view.count == 0:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        rows = self._candidate_rows(view, query)
+        if ids is not None:
+            with self.lock:
+                allowed = np.array(sorted(self.rows[doc_id] for doc_id in ids if doc_id in self.rows), dtype=np.int64)
+            allowed = allowed[allowed < view.count]
+            probed = np.intersect1d(rows, allowed, assume_unique=True)
+            # A narrow filter can miss every probed IVF list; scan all of its rows then
+            rows = probed if len(probed) >= k else allowed
+        if view.live is not None:
+            rows = rows[view.live[rows]]
+        if len(rows) == 0:
+            return []
+        approx = self._approximate_scores(view, query, rows)
+        n_candidates = min(max(rerank_candidates, k), len(rows))
+        top = rows[np.argpartition(-approx, n_candidates - 1)[:n_candidates]]
+        top.sort()
+        exact = np.asarray(view.vectors[top]) @ query
+        order = np.argsort(-exact)[:k]
+        return [(view.ids[top[i]], float(exact[i])) for i in order]
+
+    def memory_footprint(self):
+        view = self.view
+        resident = sum(
+            array.nbytes for array in (view.codes, view.scales, view.codebooks, view.centroids, view.assignment, view.live)
+            if array is not None
+        )
+        float_bytes = view.count * (self.meta["dim"] or 0) * 4
+        return {
+            "count": len(self),
+            "codec": view.codec,
+            "index_resident_bytes": resident,
+            "float32_bytes": float_bytes,
+            "index_compression": float_bytes / resident if resident else 0.0,
+            # The index alone says little when Chroma also holds the vectors, so report the whole process too,
+            # Chroma's HNSW segments included
+            "process_rss_bytes": process_rss_bytes(),
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_quantized_index(collection_name):
+    with _indexes_lock:
+        if collection_name not in _indexes:
+            _indexes[collection_name] = QuantizedIndex(os.path.join(INDEX_FOLDER, collection_name))
+        return _indexes[collection_name]
+
+
+def delete_quantized_index(collection_name):
+    with _indexes_lock:
+        _indexes.pop(collection_name, None)
+        path = os.path.join(INDEX_FOLDER, collection_name)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+            logger.info(f"Deleted quantized index for collection: {collection_name}")
+
+
+def query_index(collection, query_embedding, k=4, where=None):
+    """Chroma-style query answered by the quantized index: (id, document, metadata, score) tuples, best first."""
+    ids = None
+    if where:
+        # The index has no metadata, so resolve the filter to ids first and search only those rows
+        ids = collection.get(where=where, include=[])["ids"]
+        if not ids:
+            return []
+    hits = get_quantized_index(collection.name).search(query_embedding, k=k, ids=ids)
+    if not hits:
+        return []
+    results = collection.get(ids=[doc_id for doc_id, _ in hits], include=["documents", "metadatas"])
+    by_id = dict(zip(results["ids"], zip(results["documents"], results["metadatas"])))
+    return [(doc_id, *by_id[doc_id], score) for doc_id, score in hits if doc_id in by_id]
+
+
+def perturbed_queries(embeddings, noise=0.3, seed=0):
+    """Stored vectors nudged in a random direction, so a query does not trivially find its own chunk."""
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    directions = np.random.default_rng(seed).normal(size=vectors.shape).astype(np.float32)
+    directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+    queries = vectors + noise * np.linalg.norm(vectors, axis=1, keepdims=True) * directions
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def evaluate_against_chroma(collection, index, query_embeddings, k=4):
+    """Compare the quantized index with Chroma's HNSW search on the same queries.
+
+    Pass queries that are not themselves stored in the collection (see
+    perturbed_queries); stored vectors always find themselves and inflate recall.
+    """
+    recalls, chroma_latency, index_latency = [], [], []
+    for embedding in query_embeddings:
+        start = time.perf_counter()
+        expected = collection.query(query_embeddings=[embedding], n_results=k, include=[])["ids"][0]
+        chroma_latency.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = [doc_id for doc_id, _ in index.search(embedding, k=k)]
+        index_latency.append(time.perf_counter() - start)
+
+        if expected:
+            recalls.append(len(set(expected) & set(found)) / len(expected))
+
+    report = {
+        f"recall@{k}": float(np.mean(recalls)) if recalls else 0.0,
+        "chroma_p50_ms": float(np.percentile(chroma_latency, 50) * 1000) if chroma_latency else 0.0,
+        "index_p50_ms": float(np.percentile(index_latency, 50) * 1000) if index_latency else 0.0,
+        **index.memory_footprint(),
+    }
+    logger.info(f"Quantized index evaluation: {report}")
+    return report
+
+
+def build_from_collection(collection, batch_size=1000):
+    """Backfill the quantized index from vectors already stored in a Chroma collection."""
+    if index_only(collection):
+        raise ValueError(f"Collection {collection.name} keeps its vectors only in the quantized index")
+    delete_quantized_index(collection.name)
+    index = get_quantized_index(collection.name)
+    total = collection.count()
+    for offset in range(0, total, batch_size):
+        batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+        index.add(batch["ids"], batch["embeddings"])
+    logger.info(f"Built quantized index for {collection.name} with {len(index)} vectors")
+    return index
+
+
+if __name__ == "__main__":
+    import argparse
+    from utils.vector_store import get_chroma_client
+
+    parser = argparse.ArgumentParser(description="Build a quantized index from a Chroma collection and compare it with HNSW search")
+    parser.add_argument("collection")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--queries", type=int, default=100, help="Number of stored vectors to perturb into queries")
+    parser.add_argument("--noise", type=float, default=0.3, help="Relative size of the random perturbation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    client, openai_ef = get_chroma_client()
+    collection = client.get_collection(args.collection, embedding_function=openai_ef)
+    index = build_from_collection(collection)
+    offset = np.random.default_rng(args.seed).integers(0, max(collection.count() - args.queries, 0) + 1)
+    sample = collection.get(include=["embeddings"], limit=args.queries, offset=int(offset))["embeddings"]
+    queries = perturbed_queries(sample, noise=args.noise, seed=args.seed)
+    print(json.dumps(evaluate_against_chroma(collection, index, queries, k=args.k), indent=2))
@@ -0,0 +1,145 @@
+import json
+import os
+import pickle
+import logging
+import numpy as np
+from config import DATA_FOLDER, RERANK_FETCH_K, RERANK_TOP_N, RERANK_MODEL_PATH
+from utils.retriever import LocalReranker, rerank_features, load_rerank_model, unique_candidates
+from utils.embedding_scheduler import embedding_scheduler
+
+logger = logging.getLogger(__name__)
+
+EVAL_SET_PATH = os.path.join(DATA_FOLDER, "rerank_eval.json")
+
+
+def load_eval_set(path=EVAL_SET_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def is_relevant(doc, phrases):
+    text = doc.page_content.lower()
+    return any(phrase.lower() in text for phrase in phrases)
+
+
+def context_recall(documents, phrases):
+    """Fraction of the labeled answer phrases present somewhere in the context."""
+    context = " ".join(doc.page_content.lower() for doc in documents)
+    return sum(1 for phrase in phrases if phrase.lower() in context) / len(phrases)
+
+
+def prompt_tokens(documents):
+    return sum(embedding_scheduler.count_tokens([doc.page_content for doc in documents])) if documents else 0
+
+
+def fetch_candidates(retriever_for, eval_set):
+    """Candidates per query; retriever_for(query) builds the retriever, so per-query filters apply as in chat."""
+    return [unique_candidates(retriever_for(item["query"]).invoke(item["query"])) for item in eval_set]
+
+
+def _variant_rows(item, documents, reranker, rows):
+    by_score = sorted(documents, key=lambda doc: doc.metadata.get("vector_score", 0.0), reverse=True)
+    variants = {
+        "all_candidates": documents,
+        "vector_top_n": by_score[:reranker.top_n],
+        "reranked_top_n": reranker.compress_documents(documents, item["query"]),
+    }
+    for name, selected in variants.items():
+        rows[name].append((context_recall(selected, item["relevant"]), prompt_tokens(selected)))
+
+
+def _report(rows):
+    report = {}
+    for name, values in rows.items():
+        recalls, tokens = zip(*values) if values else ((0.0,), (0,))
+        report[name] = {"context_recall": float(np.mean(recalls)), "prompt_tokens": float(np.mean(tokens))}
+    baseline_tokens = report["all_candidates"]["prompt_tokens"]
+    report["prompt_token_reduction"] = 1 - report["reranked_top_n"]["prompt_tokens"] / baseline_tokens if baseline_tokens else 0.0
+    return report
+
+
+def evaluate(retriever_for, eval_set, reranker, candidates=None):
+    """Compare the full candidate set, the plain vector top-n and the reranked top-n."""
+    candidates = candidates if candidates is not None else fetch_candidates(retriever_for, eval_set)
+    rows = {"all_candidates": [], "vector_top_n": [], "reranked_top_n": []}
+    for item, documents in zip(eval_set, candidates):
+        _variant_rows(item, documents, reranker, rows)
+    return _report(rows)
+
+
+def fit(eval_set, candidates):
+    from sklearn.linear_model import LogisticRegression
+
+    features, labels = [], []
+    for item, documents in zip(eval_set, candidates):
+        features.extend(rerank_features(item["query"], documents))
+        labels.extend(int(is_relevant(doc, item["relevant"])) for doc in documents)
+    if len(set(labels)) < 2:
+        raise ValueError("Training needs both relevant and irrelevant candidates")
+    return LogisticRegression(class_weight="balanced").fit(features, labels)
+
+
+def cross_validate(retriever_for, eval_set, top_n=RERANK_TOP_N, folds=4, seed=0, candidates=None):
+    """Held-out metrics: each query is reranked by a model fitted without it."""
+    candidates = candidates if candidates is not None else fetch_candidates(retriever_for, eval_set)
+    folds = min(folds, len(eval_set))
+    rows = {"all_candidates": [], "vector_top_n": [], "reranked_top_n": []}
+    order = np.random.default_rng(seed).permutation(len(eval_set))
+    for fold in np.array_split(order, folds):
+        held_out = set(fold.tolist())
+        train_rows = [i for i in order if i not in held_out]
+        reranker = LocalReranker(top_n=top_n, model=fit([eval_set[i] for i in train_rows], [candidates[i] for i in train_rows]))
+        for i in fold:
+            _variant_rows(eval_set[i], candidates[i], reranker, rows)
+    report = _report(rows)
+    report["folds"] = folds
+    return report
+
+
+def train(retriever_for, eval_set, path=RERANK_MODEL_PATH, candidates=None):
+    """Fit on the whole eval set and save; report held-out quality from cross_validate, not from this model."""
+    candidates = candidates if candidates is not None else fetch_candidates(retriever_for, eval_set)
+    model = fit(eval_set, candidates)
+    with open(path, "wb") as f:
+        pickle.dump(model, f)
+    logger.info(f"Saved rerank model trained on {sum(len(documents) for documents in candidates)} candidates to {path}")
+    return model
+
+
+if __name__ == "__main__":
+    import argparse
+    from langchain_community.vectorstores import Chroma
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+    from config import OPENAI_API_KEY, OPENAI_BASE_URL, EMBEDDING_MODEL
+    from utils.vector_store import get_chroma_client
+    from utils.retriever import get_candidate_retriever, plan_retrieval_filter
+
+    parser = argparse.ArgumentParser(description="Offline evaluation of the local reranker on a labeled query set")
+    parser.add_argument("collection")
+    parser.add_argument("--eval-set", default=EVAL_SET_PATH, help="JSON list of {query, relevant: [answer phrases]}")
+    parser.add_argument("--fetch-k", type=int, default=RERANK_FETCH_K)
+    parser.add_argument("--top-n", type=int, default=RERANK_TOP_N)
+    parser.add_argument("--train", action="store_true",
+                        help="Report cross-validated (held-out) metrics, then fit and save a model on the whole set")
+    parser.add_argument("--folds", type=int, default=4)
+    args = parser.parse_args()
+
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY, openai_api_base=OPENAI_BASE_URL)
+    client, _ = get_chroma_client()
+    vector_store = Chroma(client=client, collection_name=args.collection, embedding_function=embeddings)
+    llm = ChatOpenAI(temperature=0)
+
+    def retriever_for(query):
+        # The same filtered multi-query candidates chat reranks for this query
+        return get_candidate_retriever(vector_store, llm, where=plan_retrieval_filter(vector_store, llm, query), k=args.fetch_k)
+
+    eval_set = load_eval_set(args.eval_set)
+    candidates = fetch_candidates(retriever_for, eval_set)
+
+    if args.train:
+        report = cross_validate(retriever_for, eval_set, top_n=args.top_n, folds=args.folds, candidates=candidates)
+        train(retriever_for, eval_set, candidates=candidates)
+    else:
+        # A saved model may have been fitted on this very set; treat these numbers as optimistic
+        report = evaluate(retriever_for, eval_set, LocalReranker(top_n=args.top_n, model=load_rerank_model()), candidates)
+    print(json.dumps(report, indent=2))
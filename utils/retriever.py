@@ -1,15 +1,72 @@
-from langchain.retrievers import ParentDocumentRetriever, SelfQueryRetriever, MultiQueryRetriever
+import json
+import math
+import os
+import pickle
+import re
+from collections import Counter
+from langchain.retrievers import ParentDocumentRetriever, SelfQueryRetriever, MultiQueryRetriever, ContextualCompressionRetriever
+from langchain.retrievers.multi_query import DEFAULT_QUERY_PROMPT
 from langchain_openai import ChatOpenAI
 import logging
 from langchain.storage import InMemoryStore
 from langchain.retrievers.self_query.base import SelfQueryRetriever
 from langchain.schema import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.documents import BaseDocumentCompressor
+from langchain_core.callbacks import Callbacks
+from typing import Any, Dict, List, Optional, Sequence
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from config import RERANK_FETCH_K, RERANK_TOP_N, RERANK_MODEL_PATH, SELF_QUERY_FILTER
+from utils.quantized_index import query_index, searches_quantized_index
+from utils.filter_planner import plan_filter
+from utils.cache import llm_result_cache
 
 logger = logging.getLogger(__name__)
 
-def get_retriever(vector_store):
+
+class CachedMultiQueryRetriever(MultiQueryRetriever):
+    model_name: str = ""
+
+    def generate_queries(self, question: str, run_manager: CallbackManagerForRetrieverRun) -> List[str]:
+        key = llm_result_cache.make_key(self.model_name, DEFAULT_QUERY_PROMPT.template, question)
+        queries = llm_result_cache.get(key)
+        if queries is None:
+            queries = super().generate_queries(question, run_manager)
+            llm_result_cache.set(key, queries)
+        return list(queries)
+
+
+class CachedSelfQueryRetriever(SelfQueryRetriever):
+    model_name: str = ""
+    prompt_signature: str = ""
+
+    def _structured_query(self, query: str, callbacks: Callbacks = None):
+        key = llm_result_cache.make_key(self.model_name, self.prompt_signature, query)
+        structured_query = llm_result_cache.get(key)
+        if structured_query is None:
+            structured_query = self.query_constructor.invoke({"query": query}, config={"callbacks": callbacks})
+            llm_result_cache.set(key, structured_query)
+        return structured_query
+
+    def structured_filter(self, query: str) -> Optional[Dict[str, Any]]:
+        """Where clause the LLM extracts from the query, without running the self-query search itself."""
+        try:
+            _, search_kwargs = self._prepare_query(query, self._structured_query(query))
+            return search_kwargs.get("filter")
+        except Exception as e:
+            logger.error(f"Error extracting self-query filter: {str(e)}")
+            return None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        structured_query = self._structured_query(query, run_manager.get_child())
+        new_query, search_kwargs = self._prepare_query(query, structured_query)
+        return self._get_docs_with_query(new_query, search_kwargs)
+
+def get_retriever(vector_store, where=None):
     try:
-        retriever = vector_store.as_retriever()
+        retriever = vector_store.as_retriever(search_kwargs={"filter": where} if where else {})
         logger.debug("Basic retriever created")
         return retriever
     except Exception as e:
@@ -34,18 +91,23 @@ def get_parent_child_retriever(vector_store, child_splitter):
 def get_self_query_retriever(vector_store, llm):
     try:
         metadata_field_info = [
-            {"name": "source", "description": "The source of the document", "type": "string"},
-            {"name": "date", "description": "The date the document was created", "type": "string"},
-            # Add more metadata fields as needed
+            {"name": "source", "description": "The file name or URL the document was loaded from", "type": "string"},
+            {"name": "document_type", "description": "Format of the source document, one of ['pdf', 'docx', 'csv', 'markdown', 'json', 'text', 'web']", "type": "string"},
+            {"name": "product_category", "description": "Banking product the text is about, one of ['loan', 'deposit', 'card', 'account', 'remittance', 'forex', 'digital_banking']", "type": "string"},
+            {"name": "effective_date", "description": "Date the information takes effect, as an integer YYYYMMDD", "type": "integer"},
+            {"name": "language", "description": "Language of the text, 'en' or 'ne'", "type": "string"},
+            {"name": "page", "description": "Page number within the source PDF, starting at 1", "type": "integer"},
         ]
         document_content_description = "Document containing information about various topics"
-        retriever = SelfQueryRetriever.from_llm(
+        retriever = CachedSelfQueryRetriever.from_llm(
             llm,
             vector_store,
             document_content_description,
             metadata_field_info=metadata_field_info,
             verbose=True
         )
+        retriever.model_name = getattr(llm, "model_name", type(llm).__name__)
+        retriever.prompt_signature = json.dumps([document_content_description, metadata_field_info], sort_keys=True)
         logger.debug("Self-query retriever created")
         return retriever
     except Exception as e:
@@ -53,15 +115,199 @@ def get_self_query_retriever(vector_store, llm):
         raise
 
 
-def get_multi_query_retriever(vector_store):
+def get_multi_query_retriever(vector_store, base_retriever=None, llm=None, where=None):
     try:
-        llm = ChatOpenAI(temperature=0)
-        retriever = MultiQueryRetriever.from_llm(
-            retriever=vector_store.as_retriever(),
+        llm = llm or ChatOpenAI(temperature=0)
+        retriever = CachedMultiQueryRetriever.from_llm(
+            retriever=base_retriever or get_retriever(vector_store, where),
             llm=llm
         )
+        retriever.model_name = getattr(llm, "model_name", type(llm).__name__)
         logger.debug("Multi-query retriever created")
         return retriever
     except Exception as e:
         logger.error(f"Error creating multi-query retriever: {str(e)}")
         raise
+
+
+class QuantizedIndexRetriever(BaseRetriever):
+    collection: Any
+    embeddings: Embeddings
+    k: int = 4
+    where: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        hits = query_index(self.collection, self.embeddings.embed_query(query), k=self.k, where=self.where)
+        # Dot products of unit-length embeddings, i.e. the same cosine similarity ScoredRetriever reports
+        return [
+            Document(page_content=document, metadata={**(metadata or {}), "vector_score": score, "vector_rank": rank})
+            for rank, (_, document, metadata, score) in enumerate(hits)
+        ]
+
+
+def get_quantized_retriever(vector_store, k=4, where=None):
+    try:
+        collection = vector_store._collection
+        retriever = QuantizedIndexRetriever(
+            collection=collection,
+            embeddings=vector_store.embeddings,
+            k=k,
+            where=where
+        )
+        logger.debug("Quantized index retriever created")
+        return retriever
+    except Exception as e:
+        logger.error(f"Error creating quantized index retriever: {str(e)}")
+        raise
+
+
+def cosine_from_distance(distance, space):
+    # Chroma's "l2" space returns squared distances; for unit-length embeddings both map back to cosine similarity
+    return 1.0 - distance / 2.0 if space == "l2" else 1.0 - distance
+
+
+class ScoredRetriever(BaseRetriever):
+    """Vector store search that keeps the similarity score on each document for reranking.
+
+    vector_score is the cosine similarity, the same quantity the quantized
+    index returns, so one rerank model works with either backend. vector_rank
+    is the position in this search's results, which survives the multi-query
+    union.
+    """
+    vector_store: Any
+    k: int = RERANK_FETCH_K
+    where: Optional[Dict[str, Any]] = None
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        space = (self.vector_store._collection.metadata or {}).get("hnsw:space", "l2")
+        results = self.vector_store.similarity_search_with_score(query, k=self.k, filter=self.where)
+        return [
+            Document(page_content=doc.page_content,
+                     metadata={**doc.metadata, "vector_score": cosine_from_distance(distance, space), "vector_rank": rank})
+            for rank, (doc, distance) in enumerate(results)
+        ]
+
+
+TOKEN = re.compile(r"[^\W_]+")
+RERANK_FEATURES = ["bm25", "vector_score", "term_coverage", "reciprocal_rank"]
+DEFAULT_RERANK_WEIGHTS = [0.45, 0.35, 0.15, 0.05]
+
+
+def rerank_tokens(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in ENGLISH_STOP_WORDS]
+
+
+def rerank_features(query, documents, k1=1.5, b=0.75):
+    """BM25 over the candidate set plus the vector score, query-term coverage and rank in the vector search."""
+    query_terms = set(rerank_tokens(query))
+    doc_tokens = [rerank_tokens(doc.page_content) for doc in documents]
+    if not documents:
+        return []
+    avg_len = sum(len(tokens) for tokens in doc_tokens) / len(doc_tokens) or 1.0
+    doc_freq = Counter(term for tokens in doc_tokens for term in set(tokens) & query_terms)
+    n = len(documents)
+
+    bm25 = []
+    for tokens in doc_tokens:
+        counts = Counter(tokens)
+        score = 0.0
+        for term in query_terms:
+            tf = counts.get(term, 0)
+            if tf:
+                idf = math.log(1 + (n - doc_freq[term] + 0.5) / (doc_freq[term] + 0.5))
+                score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(tokens) / avg_len))
+        bm25.append(score)
+    max_bm25 = max(bm25) or 1.0
+
+    return [
+        [
+            bm25[i] / max_bm25,
+            float(doc.metadata.get("vector_score", 0.0)),
+            len(query_terms & set(doc_tokens[i])) / len(query_terms) if query_terms else 0.0,
+            1.0 / (1 + doc.metadata.get("vector_rank", i)),
+        ]
+        for i, doc in enumerate(documents)
+    ]
+
+
+def load_rerank_model(path=RERANK_MODEL_PATH):
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        logger.error(f"Error loading rerank model: {str(e)}")
+        return None
+
+
+def unique_candidates(documents):
+    """Multi-query variants can return the same chunk with different scores; keep the best-scoring copy."""
+    unique = {}
+    for doc in documents:
+        best = unique.get(doc.page_content)
+        if best is None or doc.metadata.get("vector_score", 0.0) > best.metadata.get("vector_score", 0.0):
+            unique[doc.page_content] = doc
+    return list(unique.values())
+
+
+class LocalReranker(BaseDocumentCompressor):
+    """CPU-only reranker; uses a trained scikit-learn classifier when available, else fixed weights."""
+    top_n: int = RERANK_TOP_N
+    model: Any = None
+
+    def score(self, query: str, documents: Sequence[Document]) -> List[float]:
+        features = rerank_features(query, documents)
+        if not features:
+            return []
+        if self.model is not None:
+            return list(self.model.predict_proba(features)[:, 1])
+        return [sum(w * f for w, f in zip(DEFAULT_RERANK_WEIGHTS, row)) for row in features]
+
+    def compress_documents(self, documents: Sequence[Document], query: str, callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        documents = unique_candidates(documents)
+        scores = self.score(query, documents)
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)[:self.top_n]
+        return [
+            Document(page_content=doc.page_content, metadata={**doc.metadata, "rerank_score": float(score)})
+            for doc, score in ranked
+        ]
+
+
+def get_scored_retriever(vector_store, k=RERANK_FETCH_K, where=None):
+    try:
+        retriever = ScoredRetriever(vector_store=vector_store, k=k, where=where)
+        logger.debug("Scored retriever created")
+        return retriever
+    except Exception as e:
+        logger.error(f"Error creating scored retriever: {str(e)}")
+        raise
+
+
+def get_reranking_retriever(base_retriever, top_n=RERANK_TOP_N):
+    try:
+        retriever = ContextualCompressionRetriever(
+            base_compressor=LocalReranker(top_n=top_n, model=load_rerank_model()),
+            base_retriever=base_retriever
+        )
+        logger.debug("Reranking retriever created")
+        return retriever
+    except Exception as e:
+        logger.error(f"Error creating reranking retriever: {str(e)}")
+        raise
+
+
+def plan_retrieval_filter(vector_store, llm, query):
+    """Where clause for a RAG query: the keyword planner, plus the self-query LLM filter when SELF_QUERY_FILTER is set."""
+    # The self-query LLM call only extracts a metadata filter and runs before retrieval, so it is opt-in
+    structured_filter = get_self_query_retriever(vector_store, llm).structured_filter(query) if SELF_QUERY_FILTER else None
+    return plan_filter(query, vector_store._collection, structured_filter=structured_filter)
+
+
+def get_candidate_retriever(vector_store, llm, where=None, k=RERANK_FETCH_K):
+    """Multi-query search over the quantized index or Chroma: the candidates chat reranks and rerank_eval trains on."""
+    if searches_quantized_index(vector_store._collection):
+        base_retriever = get_quantized_retriever(vector_store, k=k, where=where)
+    else:
+        base_retriever = get_scored_retriever(vector_store, k=k, where=where)
+    return get_multi_query_retriever(vector_store, base_retriever=base_retriever, llm=llm, where=where)
@@ -0,0 +1,108 @@
+import json
+import logging
+import numpy as np
+from utils.vector_store import get_chroma_client
+from utils.quantized_index import get_quantized_index, delete_quantized_index, index_only, uses_quantized_index, PLACEHOLDER_EMBEDDING
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def _pack_strings(values):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    data = blob.tobytes()
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def export_collection(name, path, float16=False, compress=True, batch_size=5000):
+    """Write a collection's ids, documents, metadata and embeddings to a columnar .npz file."""
+    try:
+        client, openai_ef = get_chroma_client()
+        collection = client.get_collection(name, embedding_function=openai_ef)
+        ids, documents, metadatas, embeddings = [], [], [], None
+        dtype = np.float16 if float16 else np.float32
+        total = collection.count()
+        # Index-only collections hold placeholders in Chroma; their real vectors come from the quantized index
+        vectors_in_index = index_only(collection)
+        include = ["documents", "metadatas"] if vectors_in_index else ["documents", "metadatas", "embeddings"]
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=include, limit=min(batch_size, total - offset), offset=offset)
+            ids.extend(batch["ids"])
+            documents.extend(doc or "" for doc in batch["documents"])
+            metadatas.extend(json.dumps(meta or {}) for meta in batch["metadatas"])
+            vectors = get_quantized_index(name).get_vectors(batch["ids"]) if vectors_in_index else batch["embeddings"]
+            if embeddings is None:
+                # Filled batch by batch so the export never holds the vectors as Python float lists
+                embeddings = np.empty((total, len(vectors[0]) if len(vectors) else 0), dtype=dtype)
+            embeddings[offset:offset + len(vectors)] = vectors
+
+        columns = {}
+        columns["ids"], columns["ids_offsets"] = _pack_strings(ids)
+        columns["documents"], columns["documents_offsets"] = _pack_strings(documents)
+        columns["metadatas"], columns["metadatas_offsets"] = _pack_strings(metadatas)
+        columns["embeddings"] = embeddings[:len(ids)] if embeddings is not None else np.empty((0, 0), dtype=dtype)
+        columns["header"] = np.frombuffer(json.dumps({
+            "version": SNAPSHOT_VERSION,
+            "collection": name,
+            "count": len(ids),
+            "collection_metadata": collection.metadata,
+        }).encode("utf-8"), dtype=np.uint8)
+
+        save = np.savez_compressed if compress else np.savez
+        with open(path, "wb") as f:
+            save(f, **columns)
+        logger.info(f"Exported {len(ids)} records from collection {name} to {path}")
+        return len(ids)
+    except Exception as e:
+        logger.error(f"Error exporting collection snapshot: {str(e)}")
+        raise
+
+
+def import_collection(path, name, batch_size=5000):
+    """Bulk-load a snapshot into a new collection using the stored embeddings."""
+    try:
+        with np.load(path) as snapshot:
+            header = json.loads(snapshot["header"].tobytes().decode("utf-8"))
+            if header["version"] != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version: {header['version']}")
+            ids = _unpack_strings(snapshot["ids"], snapshot["ids_offsets"])
+            documents = _unpack_strings(snapshot["documents"], snapshot["documents_offsets"])
+            metadatas = [json.loads(meta) or None for meta in _unpack_strings(snapshot["metadatas"], snapshot["metadatas_offsets"])]
+            embeddings = snapshot["embeddings"].astype(np.float32)
+        if len(ids) != header["count"] or len(embeddings) != header["count"]:
+            raise ValueError(f"Snapshot holds {len(ids)} records and {len(embeddings)} embeddings, header says {header['count']}")
+
+        client, openai_ef = get_chroma_client()
+        collection = client.create_collection(name, embedding_function=openai_ef, metadata=header.get("collection_metadata"))
+        batch_size = min(batch_size, client.get_max_batch_size())
+        store_vectors = not index_only(collection)
+        try:
+            for start in range(0, len(ids), batch_size):
+                end = start + batch_size
+                collection.add(
+                    ids=ids[start:end],
+                    documents=documents[start:end],
+                    metadatas=metadatas[start:end],
+                    embeddings=embeddings[start:end].tolist() if store_vectors else [PLACEHOLDER_EMBEDDING] * len(ids[start:end])
+                )
+                if uses_quantized_index(collection):
+                    get_quantized_index(name).add(ids[start:end], embeddings[start:end])
+            if collection.count() != header["count"]:
+                raise ValueError(f"Restored {collection.count()} records, snapshot header says {header['count']}")
+        except Exception:
+            # Never leave a half-restored collection behind
+            client.delete_collection(name)
+            delete_quantized_index(name)
+            raise
+        logger.info(f"Restored {len(ids)} records from {path} into collection {name}")
+        return len(ids)
+    except Exception as e:
+        logger.error(f"Error importing collection snapshot: {str(e)}")
+        raise
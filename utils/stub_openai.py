@@ -0,0 +1,131 @@
+import json
+import time
+import random
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def fake_embedding(text, dim):
+    # langchain's OpenAIEmbeddings sends pre-tokenized inputs, so accept token lists too
+    text = text if isinstance(text, str) else json.dumps(text)
+    seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Mimics the OpenAI chat and embeddings endpoints with configurable latency, token rate and failure rate."""
+
+    server_version = "StubOpenAI/0.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status, body, headers=None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        config = self.server.stub_config
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+
+        if random.random() < config["error_rate"]:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {"retry-after": "0.05"})
+            return
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            inputs = request.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            time.sleep(config["latency"] + len(inputs) * config["latency_per_item"])
+            self._send_json(200, {
+                "object": "list",
+                "model": request.get("model"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": fake_embedding(text, config["dim"])}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            messages = request.get("messages", [])
+            prompt = " ".join(str(message.get("content", "")) for message in messages)
+            question = str(messages[-1].get("content", ""))[-80:] if messages else ""
+            words = ["stub"] * max(config["completion_tokens"] - 4, 0)
+            content = f"Stub answer about {question.strip()} " + " ".join(words)
+            time.sleep(config["chat_latency"] + config["completion_tokens"] / config["tokens_per_second"])
+            prompt_tokens = len(prompt) // 4 + 1
+            self._send_json(200, {
+                "id": f"chatcmpl-stub-{random.getrandbits(32):08x}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-3.5-turbo"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": config["completion_tokens"],
+                    "total_tokens": prompt_tokens + config["completion_tokens"],
+                },
+            })
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.05, latency_per_item=0.0, error_rate=0.0, dim=1536,
+                      chat_latency=0.3, tokens_per_second=50.0, completion_tokens=60):
+    """Start the stub in a background thread; returns the server and its base URL."""
+    server = ThreadingHTTPServer((host, port), StubOpenAIHandler)
+    server.daemon_threads = True
+    server.stub_config = {
+        "latency": latency,
+        "latency_per_item": latency_per_item,
+        "error_rate": error_rate,
+        "dim": dim,
+        "chat_latency": chat_latency,
+        "tokens_per_second": tokens_per_second,
+        "completion_tokens": completion_tokens,
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    logger.info(f"Stub OpenAI server listening on {base_url}")
+    return server, base_url
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stub for the OpenAI API")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--latency-per-item", type=float, default=0.0, help="Seconds added per embedded text")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 429")
+    parser.add_argument("--chat-latency", type=float, default=0.3, help="Seconds before the first chat token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="Chat completion generation rate")
+    parser.add_argument("--completion-tokens", type=int, default=60, help="Tokens in every chat completion")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server, base_url = start_stub_server(port=args.port, latency=args.latency,
+                                         latency_per_item=args.latency_per_item, error_rate=args.error_rate,
+                                         chat_latency=args.chat_latency, tokens_per_second=args.tokens_per_second,
+                                         completion_tokens=args.completion_tokens)
+    print(f"Set OPENAI_BASE_URL={base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import math
+import time
+from config import DATA_FOLDER
+from utils import tool_parsing
+from utils.tool_parsing import parse_loan_query, parse_forex_query
+from utils.emi_agent import emi_tool, calculate_emi, emi_result
+from utils.forex_agent import forex_tool, convert_forex, conversion_result
+
+CORPUS_PATH = os.path.join(DATA_FOLDER, "tool_parsing_corpus.json")
+
+PARSERS = {"emi": parse_loan_query, "forex": parse_forex_query}
+TOOLS = {"emi": emi_tool, "forex": forex_tool}
+FAST_PATHS = {"emi": calculate_emi, "forex": convert_forex}
+# The caches live in utils.tool_parsing and the agent modules; running this file as a script must not shadow them
+CACHES = [tool_parsing._parse_loan, tool_parsing._parse_forex, emi_result, conversion_result]
+
+
+def load_corpus(path=CORPUS_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def matches(parsed, expected):
+    for value, want in zip(parsed, expected):
+        if want is None or value is None:
+            if value is not want:
+                return False
+        elif isinstance(want, str):
+            if value != want:
+                return False
+        elif not math.isclose(value, want, rel_tol=1e-9):
+            return False
+    return True
+
+
+def clear_caches():
+    for cached in CACHES:
+        cached.cache_clear()
+
+
+def throughput(corpus, run, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for item in corpus:
+            run(item)
+    return rounds * len(corpus) / (time.perf_counter() - start)
+
+
+def cold(run):
+    def run_cold(item):
+        clear_caches()
+        return run(item)
+    return run_cold
+
+
+if __name__ == "__main__":
+    # config turns LangSmith tracing on, which would upload a trace for every timed BaseTool.run
+    os.environ["LANGCHAIN_TRACING_V2"] = "false"
+    corpus = load_corpus()
+    failures = [item for item in corpus if not matches(PARSERS[item["tool"]](item["query"]), item["expected"])]
+    print(f"Parse accuracy: {len(corpus) - len(failures)}/{len(corpus)}")
+    for item in failures:
+        print(f"  {item['query']!r}: got {tuple(PARSERS[item['tool']](item['query']))}, expected {tuple(item['expected'])}")
+
+    def tool(item):
+        return TOOLS[item["tool"]].run(item["query"])
+
+    def fast(item):
+        return FAST_PATHS[item["tool"]](item["query"])
+
+    tool_cold_qps = throughput(corpus, cold(tool), 20)
+    fast_cold_qps = throughput(corpus, cold(fast), 20)
+    fast_qps = throughput(corpus, fast, 200)
+    print(f"BaseTool.run, caches cleared: {tool_cold_qps:,.0f} queries/s")
+    print(f"Fast path, caches cleared: {fast_cold_qps:,.0f} queries/s ({fast_cold_qps / tool_cold_qps:.1f}x)")
+    print(f"Fast path, memoized: {fast_qps:,.0f} queries/s ({fast_qps / tool_cold_qps:.0f}x)")
+    # Parse regressions fail the run even though the throughput figures are still printed
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,175 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+MAGNITUDES = {
+    "k": 1e3, "thousand": 1e3,
+    "lac": 1e5, "lacs": 1e5, "lakh": 1e5, "lakhs": 1e5,
+    "m": 1e6, "mn": 1e6, "million": 1e6, "millions": 1e6,
+    "cr": 1e7, "crore": 1e7, "crores": 1e7,
+    "b": 1e9, "bn": 1e9, "billion": 1e9,
+}
+
+CURRENCY_MAPPING = {
+    "USD": ["US Dollar", "Dollar", "dollars", "$", "USD"],
+    "EUR": ["Euro", "€", "EUR"],
+    "GBP": ["British Pound", "Pound Sterling", "£", "GBP"],
+    "CHF": ["Swiss Franc", "CHF"],
+    "AUD": ["Australian Dollar", "AUD"],
+    "CAD": ["Canadian Dollar", "CAD"],
+    "SGD": ["Singapore Dollar", "SGD"],
+    "JPY": ["Japanese Yen", "Yen", "¥", "JPY"],
+    "CNY": ["Chinese Yuan", "Renminbi", "¥", "CNY"],
+    "HKD": ["Hongkong Dollar", "HKD"],
+    "DKK": ["Danish Kroner", "DKK"],
+    "MYR": ["Malaysian Ringgit", "MYR"],
+    "QAR": ["Qatari Riyal", "QAR"],
+    "SAR": ["Saudi Rial", "SAR"],
+    "SEK": ["Swedish Kroner", "SEK"],
+    "THB": ["Thai Bhat", "THB"],
+    "AED": ["UAE Dirham", "AED"],
+    "KWD": ["Kuwaiti Dinar", "KWD"],
+    "BHD": ["Bahrain Dinar", "BHD"],
+    "KRW": ["Korean Won", "KRW"],
+    "INR": ["Indian Rupees", "₹", "INR", "Rupees"],
+    "NPR": ["Nepali Rupees", "NPR", "रू", "Nepalese Rupee", "nrs"],
+}
+
+CURRENCY_ALIASES = {alias.lower(): code for code, aliases in CURRENCY_MAPPING.items() for alias in aliases}
+
+# Indian (1,00,000) and western (100,000) digit grouping
+NUMBER = r"\d{1,3}(?:,\d{2,3})+(?:\.\d+)?|\d+(?:\.\d+)?"
+MAGNITUDE = "|".join(sorted(MAGNITUDES, key=len, reverse=True))
+
+AMOUNT_PATTERN = re.compile(rf"({NUMBER})\s*({MAGNITUDE})?(?![\w%])", re.IGNORECASE)
+RATE_PATTERN = re.compile(rf"({NUMBER})\s*(?:%|percent\b|per\s+cent\b)", re.IGNORECASE)
+TENURE_PATTERN = re.compile(rf"({NUMBER})\s*(years?|yrs?|y|months?|mos?)\b", re.IGNORECASE)
+# Word aliases need word boundaries; symbols such as $ and ₹ may touch the number ("$1,000")
+CURRENCY_PATTERN = re.compile(
+    "|".join(
+        rf"(?<!\w)({re.escape(alias)})(?!\w)" if re.match(r"\w", alias) else f"({re.escape(alias)})"
+        for alias in sorted(CURRENCY_ALIASES, key=len, reverse=True)
+    ),
+    re.IGNORECASE,
+)
+# "Rs" is too ambiguous for a forex currency but still marks a loan amount ("rs. 5,00,000")
+AMOUNT_CURRENCY_PATTERN = re.compile(rf"{CURRENCY_PATTERN.pattern}|(?<!\w)rs\b\.?", re.IGNORECASE)
+YEAR_LIKE = re.compile(r"(?:19|20)\d\d")
+# Joins "5 years" and "6 months" into one tenure
+TENURE_JOINER = re.compile(r"\s*(?:,|and|&)?\s*", re.IGNORECASE)
+FROM_CURRENCY_PATTERN = re.compile(r"([^\W\d]\w*)\s+to", re.IGNORECASE)
+TO_CURRENCY_PATTERN = re.compile(r"to\s+(\w+)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+class ParsedLoan(NamedTuple):
+    amount: Optional[float]
+    rate: Optional[float]
+    tenure: Optional[float]
+
+
+class ParsedForex(NamedTuple):
+    amount: Optional[float]
+    from_currency: Optional[str]
+    to_currency: Optional[str]
+
+
+def normalize_tool_query(query: str) -> str:
+    return WHITESPACE.sub(" ", query.strip().lower())
+
+
+def parse_number(text: str, magnitude: Optional[str] = None) -> float:
+    value = float(text.replace(",", ""))
+    return value * MAGNITUDES[magnitude.lower()] if magnitude else value
+
+
+def _overlaps(span, spans):
+    return any(span[0] < end and start < span[1] for start, end in spans)
+
+
+def _next_to(span, spans, query):
+    return any(
+        (end <= span[0] and not query[end:span[0]].strip()) or (span[1] <= start and not query[span[1]:start].strip())
+        for start, end in spans
+    )
+
+
+def _best_amount(query, excluded_spans=()):
+    """The first amount with a magnitude or currency beside it, else the first bare number that is not year-like."""
+    currency_spans = [match.span() for match in AMOUNT_CURRENCY_PATTERN.finditer(query)]
+    best, best_rank = None, -1
+    for match in AMOUNT_PATTERN.finditer(query):
+        if _overlaps(match.span(), excluded_spans):
+            continue
+        if match.group(2) or _next_to(match.span(1), currency_spans, query):
+            rank = 2
+        else:
+            rank = 0 if YEAR_LIKE.fullmatch(match.group(1)) else 1
+        if rank > best_rank:
+            best, best_rank = match, rank
+    return parse_number(best.group(1), best.group(2)) if best else None
+
+
+def _tenure(query):
+    """Tenure in years and the spans it was read from; adjacent mentions add up ("5 years 6 months")."""
+    tenure, spans = None, []
+    for match in TENURE_PATTERN.finditer(query):
+        if spans and not TENURE_JOINER.fullmatch(query[spans[-1][1]:match.start()]):
+            break
+        value = parse_number(match.group(1))
+        tenure = (tenure or 0.0) + (value / 12 if match.group(2).lower().startswith("mo") else value)
+        spans.append(match.span())
+    return tenure, spans
+
+
+def currency_code(currency: str) -> str:
+    return CURRENCY_ALIASES.get(currency.lower(), currency.upper())
+
+
+@lru_cache(maxsize=4096)
+def _parse_loan(query: str) -> ParsedLoan:
+    rate_match = RATE_PATTERN.search(query)
+    tenure, tenure_spans = _tenure(query)
+    excluded = tenure_spans + ([rate_match.span()] if rate_match else [])
+
+    return ParsedLoan(
+        amount=_best_amount(query, excluded),
+        rate=parse_number(rate_match.group(1)) if rate_match else None,
+        tenure=tenure,
+    )
+
+
+def parse_loan_query(query: str) -> ParsedLoan:
+    return _parse_loan(normalize_tool_query(query))
+
+
+@lru_cache(maxsize=4096)
+def _parse_forex(query: str) -> ParsedForex:
+    mentions = []
+    for match in CURRENCY_PATTERN.finditer(query):
+        code = CURRENCY_ALIASES[match.group(match.lastindex).lower()]
+        if not mentions or mentions[-1][1] != code:
+            mentions.append((match.span(), code))
+
+    if len(mentions) >= 2:
+        from_currency, to_currency = mentions[0][1], mentions[1][1]
+    else:
+        # Fall back to the "<x> to <y>" phrasing, keeping unknown codes so the tool can report them
+        from_match = FROM_CURRENCY_PATTERN.search(query)
+        to_match = TO_CURRENCY_PATTERN.search(query)
+        from_currency = currency_code(from_match.group(1)) if from_match else None
+        to_currency = currency_code(to_match.group(1)) if to_match else None
+
+    return ParsedForex(
+        amount=_best_amount(query, [span for span, _ in mentions]),
+        from_currency=from_currency,
+        to_currency=to_currency,
+    )
+
+
+def parse_forex_query(query: str) -> ParsedForex:
+    return _parse_forex(normalize_tool_query(query))
+
+
+def missing_fields(parsed, labels):
+    return [label for value, label in zip(parsed, labels) if value is None]
@@ -6,9 +6,12 @@ import chromadb
 from chromadb.config import Settings
 from langchain_openai import OpenAIEmbeddings
 import logging
-from config import OPENAI_API_KEY
-import uuid
+from config import OPENAI_API_KEY, OPENAI_BASE_URL, VECTOR_BACKEND, EMBEDDING_MODEL
+import hashlib
 from chromadb.utils import embedding_functions
+from utils.quantized_index import get_quantized_index, delete_quantized_index, index_only, uses_quantized_index, PLACEHOLDER_EMBEDDING
+from utils.embedding_scheduler import embedding_scheduler
+from utils.faq_store import get_faq_store, delete_faq_store
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +37,8 @@ class ChromaClientSingleton:
 def get_chroma_client():
     openai_ef = embedding_functions.OpenAIEmbeddingFunction(
         api_key=OPENAI_API_KEY,
-        model_name="text-embedding-ada-002"
+        model_name=EMBEDDING_MODEL,
+        api_base=OPENAI_BASE_URL
     )
     client = ChromaClientSingleton.get_instance()
     return client, openai_ef
@@ -43,14 +47,19 @@ def get_chroma_client():
 client = get_chroma_client()
 active_collection = None
 
-openai_embeddings = OpenAIEmbeddings(model="text-embedding-ada-002", openai_api_key=OPENAI_API_KEY)
+openai_embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL, openai_api_key=OPENAI_API_KEY, openai_api_base=OPENAI_BASE_URL)
 embeddings = ChromaOpenAIEmbeddings(openai_embeddings)
 
+def collection_metadata():
+    # Recorded per collection so switching VECTOR_BACKEND later does not mix placeholder and real vectors
+    return {"vector_backend": VECTOR_BACKEND}
+
+
 def create_collection(name):
     global active_collection
     try:
         client, openai_ef = get_chroma_client()
-        active_collection = client.create_collection(name, embedding_function=openai_ef)
+        active_collection = client.create_collection(name, embedding_function=openai_ef, metadata=collection_metadata())
         logger.info(f"Collection created: {name}")
     except Exception as e:
         logger.error(f"Error creating collection: {str(e)}")
@@ -63,6 +72,8 @@ def delete_collection(name):
     try:
         client, _ = get_chroma_client()
         client.delete_collection(name)
+        delete_quantized_index(name)
+        delete_faq_store(name)
         if active_collection and active_collection.name == name:
             active_collection = None
         logger.info(f"Collection deleted: {name}")
@@ -93,21 +104,64 @@ def get_vector_store():
     global active_collection
     if active_collection is None:
         client, openai_ef = get_chroma_client()
-        active_collection = client.get_or_create_collection("default_collection", embedding_function=openai_ef)
-        logger.info("Created default collection")
+        try:
+            active_collection = client.get_collection("default_collection", embedding_function=openai_ef)
+        except ValueError:
+            active_collection = client.create_collection("default_collection", embedding_function=openai_ef, metadata=collection_metadata())
+            logger.info("Created default collection")
     return active_collection
 
 
+def chunk_id(source, position, text):
+    digest = hashlib.sha1(f"{position}:{text}".encode("utf-8")).hexdigest()[:16]
+    return f"{source}_{digest}"
+
+
 def add_texts_to_collection(texts, metadatas):
     try:
         active_collection = get_vector_store()
-        ids = [f"{metadata['source']}_{str(uuid.uuid4())}" for metadata in metadatas]
-        active_collection.add(
-            documents=texts,
-            metadatas=metadatas,
-            ids=ids
-        )
-        logger.info(f"Added {len(texts)} texts to collection {active_collection.name}")
+        # Deterministic ids let a failed ingest resume by skipping batches that were already committed
+        ids = [chunk_id(metadata['source'], i, text) for i, (text, metadata) in enumerate(zip(texts, metadatas))]
+        index = get_quantized_index(active_collection.name) if uses_quantized_index(active_collection) else None
+        in_chroma = set(active_collection.get(ids=ids, include=[])["ids"])
+        # A chunk only counts as done once both stores have it, so a failed index add is retried on resume
+        in_index = index.contains(ids) if index is not None else in_chroma
+        existing = in_chroma & in_index
+        pending = [i for i, doc_id in enumerate(ids) if doc_id not in existing]
+        if existing:
+            logger.info(f"Skipping {len(existing)} texts already in collection {active_collection.name}")
+
+        pending_texts = [texts[i] for i in pending]
+        store_vectors = not index_only(active_collection)
+        for batch, vectors in embedding_scheduler.embed(pending_texts):
+            missing = [j for j, i in enumerate(batch) if ids[pending[i]] not in in_chroma]
+            if missing:
+                active_collection.add(
+                    documents=[pending_texts[batch[j]] for j in missing],
+                    metadatas=[metadatas[pending[batch[j]]] for j in missing],
+                    embeddings=[vectors[j] for j in missing] if store_vectors else [PLACEHOLDER_EMBEDDING] * len(missing),
+                    ids=[ids[pending[batch[j]]] for j in missing]
+                )
+            if index is not None:
+                index.add([ids[pending[i]] for i in batch], vectors)
+        logger.info(f"Added {len(pending)} texts to collection {active_collection.name}")
+
+        # Re-ingesting a source replaces it: chunks that no longer exist in the new version are removed
+        current = set(ids)
+        removed = 0
+        for source in {metadata['source'] for metadata in metadatas}:
+            stale = [doc_id for doc_id in active_collection.get(where={"source": source}, include=[])["ids"] if doc_id not in current]
+            if stale:
+                active_collection.delete(ids=stale)
+                if index is not None:
+                    index.delete(stale)
+                removed += len(stale)
+                logger.info(f"Removed {len(stale)} outdated chunks of {source}")
+        if removed:
+            # Precomputed answers built on the removed chunks must not outlive them
+            faq_store = get_faq_store(active_collection.name)
+            if faq_store.invalidate(active_collection):
+                faq_store.save()
     except Exception as e:
         logger.error(f"Error adding texts to collection: {str(e)}")
         raise